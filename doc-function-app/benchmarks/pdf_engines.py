@@ -0,0 +1,75 @@
+"""
+Compares the PDF text engines in function_app on a folder of PDFs.
+
+    python benchmarks/pdf_engines.py path/to/pdfs [--repeat 3]
+
+For each engine prints pages per second and parity with pdfplumber, the
+token overlap between the two outputs (1.0 means the same words in the
+same quantities). "pdfium+fallback" is what the app runs by default.
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+# function_app builds its OpenAI client at import; the benchmark never calls it
+os.environ.setdefault("ENDPOINT_URL", "https://localhost")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "unused")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import function_app  # noqa: E402
+
+
+def parity(reference: list, candidate: list) -> float:
+    ref = Counter(function_app.WORD_RE.findall("\n".join(reference).lower()))
+    cand = Counter(function_app.WORD_RE.findall("\n".join(candidate).lower()))
+    total = max(sum(ref.values()), sum(cand.values()))
+    return sum((ref & cand).values()) / total if total else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("folder")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdfs = sorted(Path(args.folder).glob("**/*.pdf"))
+    if not pdfs:
+        sys.exit(f"No PDFs under {args.folder}")
+
+    engines = dict(function_app.PDF_ENGINES)
+    engines["pdfium+fallback"] = lambda stream: function_app.extract_pdf_pages(stream, "pdfium")
+
+    totals = {name: {"pages": 0, "seconds": 0.0, "parity": []} for name in engines}
+
+    for pdf in pdfs:
+        data = pdf.read_bytes()
+        reference = function_app.extract_pages_pdfplumber(io.BytesIO(data))
+
+        for name, extract in engines.items():
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                pages = extract(io.BytesIO(data))
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+
+            totals[name]["pages"] += len(pages)
+            totals[name]["seconds"] += best
+            totals[name]["parity"].append(parity(reference, pages))
+
+    print(f"{len(pdfs)} PDFs, best of {args.repeat} runs\n")
+    print(f"{'engine':<18}{'pages/s':>10}{'parity':>10}{'min parity':>12}")
+    for name, t in totals.items():
+        rate = t["pages"] / t["seconds"] if t["seconds"] else float("inf")
+        print(
+            f"{name:<18}{rate:>10.1f}"
+            f"{sum(t['parity']) / len(t['parity']):>10.3f}{min(t['parity']):>12.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Bytes on the wire and encode time for representative API payloads, as
+served by function_app's response helpers.
+
+    python benchmarks/responses.py [--repeat 50]
+
+Times stdlib json against encode_json (orjson when installed), then
+json_response end to end for each content coding it can negotiate
+(identity, gzip, brotli).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import azure.functions as func
+
+# function_app builds its OpenAI client at import; the benchmark never calls it
+os.environ.setdefault("ENDPOINT_URL", "https://localhost")
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "unused")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import function_app  # noqa: E402
+
+ACCEPT = {"identity": "identity", "gzip": "gzip", "br": "br, gzip"}
+
+
+def payloads() -> dict:
+    random.seed(7)
+    start = date(2023, 1, 1)
+    progress = 0.0
+    chart = []
+    for i in range(3 * 365):
+        if random.random() < 0.08:
+            progress = min(100.0, progress + round(random.uniform(0.5, 3), 1))
+        chart.append({"date": (start + timedelta(days=i)).strftime("%Y-%m-%d"), "progress": progress})
+
+    files = [
+        {
+            "name": f"DPR-{i:04d}-Level-{i % 12}-Zone-{i % 5}.pdf",
+            "last_modified": f"2025-{1 + i % 12:02d}-{1 + i % 28:02d}T08:{i % 60:02d}:00+00:00",
+            "content_type": "application/pdf",
+        }
+        for i in range(2000)
+    ]
+
+    comparison = "\n".join(
+        f"| Scope item {i} | Contract A clause {i}.{i % 7} covers partition works | "
+        f"Contract B section {i % 9} excludes fire stopping at slab edge |"
+        for i in range(400)
+    )
+
+    return {
+        "progress-chart (3y daily)": {"project": "Tower A", "chartData": chart},
+        "files/meta (2000 files)": files,
+        "compare (markdown)": {"comparison": comparison},
+    }
+
+
+def timed(fn, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+def request(accept_encoding: str) -> func.HttpRequest:
+    return func.HttpRequest("GET", "/api/bench", headers={"Accept-Encoding": accept_encoding}, body=b"")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"best of {args.repeat} runs; times in ms; "
+          f"gzip level {function_app.RESPONSE_GZIP_LEVEL}, "
+          f"brotli quality {function_app.RESPONSE_BROTLI_QUALITY}\n")
+    print(f"{'payload':<28}{'json ms':>9}{'encode ms':>11}"
+          + "".join(f"{name + ' B':>12}{name + ' ms':>13}" for name in ACCEPT))
+
+    for name, payload in payloads().items():
+        _, json_ms = timed(lambda: json.dumps(payload).encode("utf-8"), args.repeat)
+        _, encode_ms = timed(lambda: function_app.encode_json(payload), args.repeat)
+
+        row = f"{name:<28}{json_ms:>9.2f}{encode_ms:>11.2f}"
+        for accept in ACCEPT.values():
+            req = request(accept)
+            response, ms = timed(lambda: function_app.json_response(payload, req=req), args.repeat)
+            row += f"{len(response.get_body()):>12}{ms:>13.2f}"
+
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,32 @@
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from functools import lru_cache
+import ctypes
 from datetime import datetime
+import gzip
+import hashlib
 import io
 import math
+import mmap
 import re
+import sqlite3
+import tempfile
+import zlib
+import numpy as np
 import azure.functions as func
+import azurefunctions.extensions.bindings.blob as blob_bindings
 import json
 import logging
 import os
+import random
+import threading
+import time
+import openai
 import pdfplumber
 from dotenv import load_dotenv
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
 from azure.storage.blob import BlobServiceClient, ContentSettings
 from openai import AzureOpenAI
 from azure.storage.blob import BlobClient
@@ -36,14 +55,557 @@ client = AzureOpenAI(
     azure_endpoint=AZURE_OPENAI_ENDPOINT,
     api_key=AZURE_OPENAI_KEY,
     api_version="2025-01-01-preview",
+    # Retries are scheduled by the LLM gateway below
+    max_retries=0,
 )
 
 
+# ---------------- LLM gateway ----------------
+# Every model call goes through chat_completion. It keeps this worker
+# within its share of the deployment's quota (set LLM_TOKENS_PER_MINUTE /
+# LLM_REQUESTS_PER_MINUTE to the deployment limit divided by the number of
+# instances), admits waiting callers fairly across projects, retries 429s
+# and transient errors with jittered backoff, and lets identical
+# concurrent prompts share one call. LLM_MAX_WAIT_SECONDS bounds a whole
+# call, admission waits and retries included, so HTTP callers get a 503
+# with Retry-After well inside the Functions front end's ~230s limit.
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "80000"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "480"))
+LLM_COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "1000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_MAX_WAIT_SECONDS = float(os.getenv("LLM_MAX_WAIT_SECONDS", "60"))
+LLM_MAX_BACKOFF_SECONDS = 30.0
+
+
+class LLMBusyError(Exception):
+    """The model could not be reached within the wait budget."""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Model is busy, retry in {math.ceil(retry_after)}s")
+        self.retry_after = retry_after
+
+
+class LLMAdmission:
+    """
+    Token-bucket admission for requests and tokens per minute.
+
+    Waiting callers are admitted one at a time, preferring the project with
+    the fewest calls in flight and then arrival order, so one busy project
+    cannot starve the others.
+    """
+
+    def __init__(self, tokens_per_minute: int, requests_per_minute: int):
+        self.token_capacity = float(tokens_per_minute)
+        self.request_capacity = float(requests_per_minute)
+        self.tokens = self.token_capacity
+        self.requests = self.request_capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.active = {}
+        self.waiting = []
+        self.sequence = 0
+        self.cond = threading.Condition()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(self.token_capacity, self.tokens + elapsed * self.token_capacity / 60)
+        self.requests = min(self.request_capacity, self.requests + elapsed * self.request_capacity / 60)
+
+    def _wait_time(self, cost: float, now: float) -> float:
+        """Seconds until both buckets can cover the call (0 if they can now)."""
+        waits = [self.paused_until - now]
+        if self.tokens < cost:
+            waits.append((cost - self.tokens) * 60 / self.token_capacity)
+        if self.requests < 1:
+            waits.append((1 - self.requests) * 60 / self.request_capacity)
+        return max(waits + [0.0])
+
+    def _next_ticket(self):
+        return min(self.waiting, key=lambda t: (self.active.get(t[1], 0), t[0]))
+
+    def acquire(self, project: str, cost: float, deadline: float | None = None):
+        """Blocks until admitted; LLMBusyError if that can't happen by deadline (monotonic)."""
+        cost = min(cost, self.token_capacity)
+        if deadline is None:
+            deadline = time.monotonic() + LLM_MAX_WAIT_SECONDS
+
+        with self.cond:
+            self.sequence += 1
+            ticket = (self.sequence, project)
+            self.waiting.append(ticket)
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    wait = self._wait_time(cost, now)
+
+                    if self._next_ticket() == ticket and wait <= 0:
+                        break
+                    if now >= deadline:
+                        raise LLMBusyError(max(wait, 1.0))
+
+                    self.cond.wait(min(max(wait, 0.05), deadline - now))
+            finally:
+                self.waiting.remove(ticket)
+                self.cond.notify_all()
+
+            self.tokens -= cost
+            self.requests -= 1
+            self.active[project] = self.active.get(project, 0) + 1
+
+    def release(self, project: str, estimated: float, actual: float | None = None):
+        with self.cond:
+            self.active[project] -= 1
+            if not self.active[project]:
+                del self.active[project]
+            if actual is not None:
+                # Settle the estimate against what the call really used
+                self.tokens += min(estimated, self.token_capacity) - actual
+            self.cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold all admissions, e.g. when the service answers with retry-after."""
+        with self.cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+llm_admission = LLMAdmission(LLM_TOKENS_PER_MINUTE, LLM_REQUESTS_PER_MINUTE)
+_llm_flights = {}
+_llm_flights_lock = threading.Lock()
+llm_prompt_stats = {}
+
+
+def estimate_prompt_tokens(messages: list) -> int:
+    """Rough prompt size (about four characters per token) plus the expected answer."""
+    return sum(len(m["content"]) for m in messages) // 4 + LLM_COMPLETION_TOKEN_ESTIMATE
+
+
+def retry_after_seconds(error) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+
+    return None
+
+
+def backoff_seconds(attempt: int) -> float:
+    return min(LLM_MAX_BACKOFF_SECONDS, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+def record_prompt_usage(prompt_name: str, usage):
+    """
+    Logs prompt and cached-prompt token counts per template and keeps
+    running totals, to verify how much of each prompt the service served
+    from its prefix cache.
+    """
+    if usage is None:
+        return
+
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+    with _llm_flights_lock:
+        stats = llm_prompt_stats.setdefault(
+            prompt_name, {"calls": 0, "promptTokens": 0, "cachedTokens": 0}
+        )
+        stats["calls"] += 1
+        stats["promptTokens"] += usage.prompt_tokens
+        stats["cachedTokens"] += cached
+
+    logging.info(
+        f"Model usage | Prompt={prompt_name} | prompt_tokens={usage.prompt_tokens} "
+        f"| cached_tokens={cached} | completion_tokens={usage.completion_tokens}"
+    )
+
+
+def wait_for_retry(retry_after: float, deadline: float, jitter: float = 0.0):
+    """Sleeps before a retry, or raises LLMBusyError when it would overrun the deadline."""
+    remaining = deadline - time.monotonic()
+    if retry_after >= remaining:
+        raise LLMBusyError(retry_after)
+
+    time.sleep(min(retry_after + jitter, remaining))
+
+
+def _call_model(messages: list, temperature: float, project: str, prompt_name: str):
+    estimated = estimate_prompt_tokens(messages)
+    deadline = time.monotonic() + LLM_MAX_WAIT_SECONDS
+    retry_after = None
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        llm_admission.acquire(project, estimated, deadline)
+
+        try:
+            completion = client.chat.completions.create(
+                model=DEPLOYMENT_NAME,
+                messages=messages,
+                temperature=temperature
+            )
+        except openai.RateLimitError as e:
+            llm_admission.release(project, estimated)
+            retry_after = retry_after_seconds(e) or backoff_seconds(attempt)
+            llm_admission.pause(retry_after)
+            logging.warning(f"Model rate limited | Project={project} | retry in {retry_after:.1f}s")
+            wait_for_retry(retry_after, deadline, random.uniform(0, 1))
+            continue
+        except (openai.APIConnectionError, openai.InternalServerError) as e:
+            llm_admission.release(project, estimated)
+            retry_after = retry_after_seconds(e) or backoff_seconds(attempt)
+            logging.warning(f"Model call failed ({type(e).__name__}) | Project={project} | retry in {retry_after:.1f}s")
+            wait_for_retry(retry_after, deadline)
+            continue
+        except Exception:
+            llm_admission.release(project, estimated)
+            raise
+
+        usage = getattr(completion, "usage", None)
+        llm_admission.release(project, estimated, usage.total_tokens if usage else None)
+        record_prompt_usage(prompt_name, usage)
+        return completion
+
+    raise LLMBusyError(retry_after or LLM_MAX_BACKOFF_SECONDS)
+
+
+def chat_completion(messages: list, temperature: float, project: str | None = None,
+                    prompt_name: str = "adhoc"):
+    """
+    Drop-in for client.chat.completions.create on DEPLOYMENT_NAME.
+    Concurrent calls with the same messages and temperature share one
+    request; raises LLMBusyError when the quota can't be met in time.
+    """
+    key = hashlib.sha256(
+        json.dumps([DEPLOYMENT_NAME, temperature, messages], sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+    with _llm_flights_lock:
+        flight = _llm_flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _llm_flights[key] = _Flight()
+
+    if not leader:
+        logging.info(f"Joining in-flight model call | Project={project}")
+        flight.done.wait()
+        if flight.error:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = _call_model(messages, temperature, project or "", prompt_name)
+        return flight.result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _llm_flights_lock:
+            del _llm_flights[key]
+        flight.done.set()
+
+
+# ---------------- Prompts ----------------
+# Each prompt is a stable prefix followed by a variable suffix. The
+# prefix holds the instructions and the large baseline document(s); the
+# suffix holds per-request fields (dates, reporting week, question).
+# Requests that share a baseline then share a byte-identical prefix, which
+# the service's automatic prompt caching can reuse. Keep per-request
+# values out of the prefixes.
+PROMPT_TEMPLATES = {
+    "compare": {
+        "system": "You compare construction contracts.",
+        "prefix": """You are a senior construction contract analyst with expertise in interior construction projects.
+
+Compare the contracts below in a concise, executive-friendly format. For each point, include a citation referring to the section or line in the provided PDF from which the summary is taken.
+
+Instructions:
+1. Start with a **Final Recommendation**: which contract is preferable and why.
+2. Immediately follow with **Reasons** (bullet points, concise).
+3. Present **Key Differences** in a **table format** using the actual file names as headers (layout given after the contracts).
+4. Cover the following aspects in the table: Scope, Commercials, Timelines, Risks.
+5. For each bullet point or table entry, reference the PDF section, e.g., "Scope of Work – Section 1" or "Weekly Execution Timeline – Section 3".
+6. Avoid long paragraphs—use bullet points and tables for clarity.
+7. Always reference the actual file names in all sections.
+
+Project: {project}
+
+Contract 1: {file_1}
+Content:
+{file_1_text}
+
+Contract 2: {file_2}
+Content:
+{file_2_text}
+""",
+        "suffix": """
+Key Differences table layout:
+   | Aspect       | {file_1} | {file_2} |
+   |-------------|-----------|-----------|
+""",
+    },
+    "anomaly": {
+        "system": "You detect construction compliance anomalies.",
+        "prefix": """You are a senior construction controls and contract compliance analyst.
+
+Compare the DAILY REPORT against the FINAL SOW and list deviations, following the evaluation rules given after the documents.
+
+OUTPUT FORMAT (MANDATORY — UI DEPENDS ON THIS):
+• Category | Expected | Observed | Impact: High / Medium / Low
+
+STYLE RULES:
+- One bullet per deviation
+- Short, factual statements only
+- No explanations
+- No headings
+- No extra text before or after bullets
+
+If NO valid deviations exist, respond with EXACTLY:
+No deviations detected for the current reporting period.
+
+Project: {project}
+
+FINAL SOW (Baseline):
+{final_sow_text}
+""",
+        "suffix": """
+CONTEXT (AUTHORITATIVE):
+- Project start date: {start_date}
+- Daily report date: {report_date}
+- Calculated reporting week: Week {reporting_week}
+
+STRICT EVALUATION RULES:
+1. Only assess activities that were contractually scheduled
+   to START or PROGRESS in Week {reporting_week} or earlier.
+2. Any activity scheduled AFTER Week {reporting_week}:
+   - MUST be Impact: Low
+   - Use wording: "Not yet due as per contract timeline"
+3. Medium or High impact is allowed ONLY if:
+   - The activity was due by Week {reporting_week}
+   - AND the Daily Report shows a clear deviation
+4. Payment-related deviations:
+   - Medium impact ONLY if the linked physical milestone
+     was due by Week {reporting_week}
+   - Otherwise Impact: Low
+
+DAILY REPORT (Week {reporting_week}):
+{daily_report_text}
+""",
+    },
+    "document_chat": {
+        "system": "You answer user questions based on provided documents.",
+        "prefix": """You are a senior construction project assistant with expert knowledge in reading and analyzing construction project documents.
+
+TASK:
+Answer the user's question based ONLY on the content of the provided document.
+Do NOT provide any information that is not in the document.
+If the question requires analysis or recommendations (e.g., vendor selection), base your reasoning strictly on the document content.
+
+RESPONSE REQUIREMENTS:
+- Be precise, factual, and detailed.
+- Summarize content when asked for a summary.
+- If asked for recommendations (e.g., which vendor to choose), provide reasoning strictly based on the document's information.
+- Keep your answer concise but comprehensive.
+- If the answer is not in the document, respond with:
+  "The document does not contain information to answer this question."
+
+Project: {project}
+
+DOCUMENT: {file_name}
+Content:
+{file_text}
+""",
+        "suffix": """
+USER QUESTION:
+{question}
+""",
+    },
+    "project_chat": {
+        "system": "You answer user questions based on provided documents.",
+        "prefix": """You are a senior construction project assistant with expert knowledge in reading and analyzing construction project documents.
+
+TASK:
+Answer the user's question based ONLY on the passages below, which were retrieved from the project's documents.
+Do NOT provide any information that is not in the passages.
+
+RESPONSE REQUIREMENTS:
+- Be precise, factual, and concise.
+- Cite the file and page for every fact, e.g. "(Subcontract-Fire.pdf, page 3)".
+- If the answer is not in the passages, respond with:
+  "The project documents do not contain information to answer this question."
+
+Project: {project}
+""",
+        "suffix": """
+PASSAGES:
+{passages}
+
+USER QUESTION:
+{question}
+""",
+    },
+    "progress": {
+        "system": "You analyze construction project progress.",
+        "prefix": """You are a senior construction project analyst.
+
+TASK:
+For each daily report given after the activity list, compare the activities with the FINAL report activities and estimate cumulative progress.
+Cumulative progress never decreases. The local estimate comes from keyword matching and may be off.
+
+Return ONLY valid JSON in this format:
+[
+  {{"date": "YYYY-MM-DD", "progress": number}}
+]
+
+FINAL REPORT ACTIVITIES:
+{final_activities}
+""",
+        "suffix": """
+Cumulative progress before these dates: {previous_progress}%
+
+DAILY REPORTS:
+{daily_texts}
+""",
+    },
+}
+
+
+def render_prompt(name: str, **fields) -> list:
+    """
+    Builds the chat messages for a named template. Output depends only on
+    the template and the field values, so equal baselines always render
+    to equal prefixes.
+    """
+    template = PROMPT_TEMPLATES[name]
+    prefix = template["prefix"].format(**fields)
+    suffix = template["suffix"].format(**fields)
+
+    return [
+        {"role": "system", "content": template["system"]},
+        {"role": "user", "content": prefix + suffix}
+    ]
+
+
+def llm_busy_response(error: LLMBusyError, req: func.HttpRequest) -> func.HttpResponse:
+    return error_response(
+        str(error), 503, req,
+        headers={"Retry-After": str(math.ceil(error.retry_after))}
+    )
+
+
+# ---------------- HTTP responses ----------------
+# All handlers answer through json_response / error_response. Bodies are
+# encoded with orjson when it is installed, and bodies of at least
+# RESPONSE_COMPRESS_MIN_BYTES are compressed with brotli or gzip when the
+# client's Accept-Encoding allows it.
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESS_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = 6
+RESPONSE_BROTLI_QUALITY = 5
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def encode_json(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def negotiate_encoding(req: func.HttpRequest | None) -> str | None:
+    """Best supported content coding from Accept-Encoding: br, then gzip."""
+    if req is None:
+        return None
+
+    accepted = {}
+    for item in (req.headers.get("Accept-Encoding") or "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.lower()] = q
+
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+
+def json_response(payload, status_code: int = 200, req: func.HttpRequest | None = None,
+                  headers: dict | None = None) -> func.HttpResponse:
+    body = encode_json(payload)
+    headers = dict(headers or {})
+
+    if req is not None:
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate_encoding(req) if len(body) >= RESPONSE_COMPRESS_MIN_BYTES else None
+        if encoding == "br":
+            body = brotli.compress(body, quality=RESPONSE_BROTLI_QUALITY)
+            headers["Content-Encoding"] = "br"
+        elif encoding == "gzip":
+            body = gzip.compress(body, compresslevel=RESPONSE_GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+
+    return func.HttpResponse(
+        body,
+        status_code=status_code,
+        headers=headers,
+        mimetype="application/json"
+    )
+
+
+def error_response(message: str, status_code: int, req: func.HttpRequest | None = None,
+                   headers: dict | None = None) -> func.HttpResponse:
+    return json_response({"error": message}, status_code, req, headers)
+
+
 # ---------------- Function App ----------------
 app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
 
 
 
+@app.route(route="llm/prompt-cache", methods=["GET"])
+def llm_prompt_cache_stats(req: func.HttpRequest) -> func.HttpResponse:
+    """Per-template prompt and cached-prompt token totals for this worker."""
+    with _llm_flights_lock:
+        stats = {name: dict(values) for name, values in llm_prompt_stats.items()}
+
+    for values in stats.values():
+        values["cachedRatio"] = round(
+            values["cachedTokens"] / values["promptTokens"], 3
+        ) if values["promptTokens"] else 0
+
+    return json_response(stats, req=req)
+
+
 @app.route(
     route="projects/{projectName}/upload",
     methods=["POST"],
@@ -56,16 +618,17 @@ def upload_project_file(req: func.HttpRequest) -> func.HttpResponse:
         project_name = req.route_params.get("projectName")
         file = req.files.get("file")
 
-        if not project_name or not file:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName and file are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+        if not project_name:
+            return error_response("projectName and file are required", 400, req)
 
         # Sanitize project name
         project_name = project_name.replace("..", "").replace("/", "_")
 
+        response, upload = check_upload_hash(req, project_name, f"{project_name}/", file)
+        if response:
+            return response
+        spool, sha, size = upload
+
         conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
         container_name = os.getenv("BLOB_CONTAINER_NAME")
 
@@ -76,32 +639,42 @@ def upload_project_file(req: func.HttpRequest) -> func.HttpResponse:
 
         blob_client = container_client.get_blob_client(blob_path)
 
-        blob_client.upload_blob(
-            file.stream.read(),
-            overwrite=True,
-            content_settings=ContentSettings(
-                content_type=file.content_type
+        with spool:
+            upload_result = blob_client.upload_blob(
+                spool,
+                length=size,
+                overwrite=True,
+                content_settings=ContentSettings(
+                    content_type=file.content_type
+                )
             )
-        )
 
-        return func.HttpResponse(
-            json.dumps({
+        record_content_hash(project_name, sha, blob_path, upload_result["etag"])
+
+        if file.filename.lower().endswith(".pdf"):
+            try:
+                pages = read_pdf_pages_from_blob_path(blob_path, pdf_engine_for("ingest"))
+                save_document_pages(project_name, blob_path, upload_result["etag"], pages)
+                index_document(project_name, blob_path, upload_result["etag"], pages)
+            except Exception:
+                # Search catches up on the next upload or warm-up; the file itself is stored
+                logging.exception(f"Failed to index {blob_path}")
+
+        return json_response(
+            {
                 "success": True,
                 "project": project_name,
                 "file": file.filename,
-                "path": blob_path
-            }),
-            status_code=200,
-            mimetype="application/json"
+                "path": blob_path,
+                "sha256": sha,
+                "deduplicated": False
+            },
+            req=req
         )
 
     except Exception as e:
         logging.exception("Blob upload failed")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        return error_response(str(e), 500, req)
 
 @app.route(
     route="projects",
@@ -119,19 +692,13 @@ def list_projects(req: func.HttpRequest) -> func.HttpResponse:
         projects = set()
         for blob in container_client.list_blobs():
             projects.add(blob.name.split("/")[0])
+        projects.discard(DERIVED_PREFIX)
 
-        return func.HttpResponse(
-            json.dumps(sorted(projects)),
-            mimetype="application/json"
-        )
+        return json_response(sorted(projects), req=req)
 
     except Exception as e:
         logging.exception("Failed to list projects")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        return error_response(str(e), 500, req)
 
 
 @app.route(
@@ -144,11 +711,7 @@ def list_project_files(req: func.HttpRequest) -> func.HttpResponse:
         project_name = req.route_params.get("projectName")
 
         if not project_name:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("projectName required", 400, req)
 
         conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
         container_name = os.getenv("BLOB_CONTAINER_NAME")
@@ -162,20 +725,57 @@ def list_project_files(req: func.HttpRequest) -> func.HttpResponse:
         for blob in container_client.list_blobs(name_starts_with=prefix):
             files.append(blob.name.replace(prefix, ""))
 
-        return func.HttpResponse(
-            json.dumps(files),
-            mimetype="application/json"
-        )
+        return json_response(files, req=req)
 
     except Exception as e:
         logging.exception("Failed to list project files")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        return error_response(str(e), 500, req)
     
 
+# ---------------- Final report payloads ----------------
+# Row content (the extracted PDF text) is stored out of line as a
+# gzip-compressed, content-addressed blob; the workbook keeps the
+# metadata and a "contentRef" pointer. Identical content is stored once,
+# and readers fetch it only for the rows they need.
+def payload_content_path(project: str, content_ref: str) -> str:
+    return derived_blob_path(project, "payloads", f"{content_ref.split(':', 1)[1]}.txt.gz")
+
+
+def store_payload_content(project: str, content: str) -> str:
+    data = content.encode("utf-8")
+    content_ref = f"sha256:{hashlib.sha256(data).hexdigest()}"
+
+    try:
+        get_blob_client(payload_content_path(project, content_ref)).upload_blob(
+            gzip.compress(data),
+            overwrite=False,
+            content_settings=GZIP_CONTENT_SETTINGS
+        )
+    except ResourceExistsError:
+        # Same hash, same content
+        pass
+
+    return content_ref
+
+
+@lru_cache(maxsize=64)
+def load_payload_content(project: str, content_ref: str) -> str:
+    # Content-addressed blobs never change, so caching in-process is safe
+    data, _ = download_gzip_blob(get_blob_client(payload_content_path(project, content_ref)))
+    return data.decode("utf-8")
+
+
+def offload_payload_content(project: str, payload: dict) -> dict:
+    """Copy of payload with "content" swapped for a contentRef pointer."""
+    if "content" not in payload:
+        return payload
+
+    row = {k: v for k, v in payload.items() if k != "content"}
+    row["contentRef"] = store_payload_content(project, payload["content"] or "")
+    row["contentLength"] = len(payload["content"] or "")
+    return row
+
+
 def append_to_final_report(project: str, entry_type: str, payload: dict):
     excel_path = f"daily-reports/{project}/final-report.xlsx"
     blob_client = get_blob_client(excel_path)
@@ -197,7 +797,7 @@ def append_to_final_report(project: str, entry_type: str, payload: dict):
     ws.append([
         datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
         entry_type,
-        json.dumps(payload)
+        json.dumps(offload_payload_content(project, payload))
     ])
 
     wb.save(output)
@@ -224,15 +824,17 @@ def upload_daily_report(req: func.HttpRequest) -> func.HttpResponse:
         project_name = req.route_params.get("projectName")
         file = req.files.get("file")
 
-        if not project_name or not file:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName and file are required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+        if not project_name:
+            return error_response("projectName and file are required", 400, req)
 
         project_name = project_name.replace("..", "").replace("/", "_")
 
+        # A re-submitted report reuses the stored blob, record and xlsx row
+        response, upload = check_upload_hash(req, project_name, f"daily-reports/{project_name}/", file)
+        if response:
+            return response
+        spool, sha, size = upload
+
         conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
         container_name = os.getenv("BLOB_CONTAINER_NAME")
 
@@ -243,16 +845,28 @@ def upload_daily_report(req: func.HttpRequest) -> func.HttpResponse:
         blob_client = container_client.get_blob_client(blob_path)
 
         # 1️⃣ Upload PDF
-        blob_client.upload_blob(
-            file.stream.read(),
-            overwrite=True,
-            content_settings=ContentSettings(
-                content_type=file.content_type
+        with spool:
+            upload_result = blob_client.upload_blob(
+                spool,
+                length=size,
+                overwrite=True,
+                content_settings=ContentSettings(
+                    content_type=file.content_type
+                )
             )
-        )
 
-        # 2️⃣ Extract PDF text
-        extracted_text = read_pdf_from_blob_path(blob_path)
+        # 2️⃣ Extract PDF text and parse the structured fields once
+        pages = read_pdf_pages_from_blob_path(blob_path, pdf_engine_for("ingest"))
+        extracted_text = "".join(p + "\n" for p in pages if p)
+
+        record = parse_daily_report(pages)
+        save_daily_report_record(project_name, file.filename, record)
+
+        try:
+            save_document_pages(project_name, blob_path, upload_result["etag"], pages)
+            index_document(project_name, blob_path, upload_result["etag"], pages)
+        except Exception:
+            logging.exception(f"Failed to index {blob_path}")
 
         # 3️⃣ Prepare payload
         payload = {
@@ -260,7 +874,8 @@ def upload_daily_report(req: func.HttpRequest) -> func.HttpResponse:
             "fileName": file.filename,
             "uploadedAt": datetime.utcnow().isoformat(),
             "type": "daily_report",
-            "content": extracted_text
+            "content": extracted_text,
+            "record": record
         }
 
         # 4️⃣ Append to final-report.xlsx
@@ -270,151 +885,292 @@ def upload_daily_report(req: func.HttpRequest) -> func.HttpResponse:
             payload=payload
         )
 
-        return func.HttpResponse(
-            json.dumps({
+        # Recorded last so a failed ingest is retried rather than deduplicated
+        record_content_hash(project_name, sha, blob_path, upload_result["etag"])
+
+        return json_response(
+            {
                 "success": True,
                 "project": project_name,
                 "file": file.filename,
-                "path": blob_path
-            }),
-            status_code=200,
-            mimetype="application/json"
+                "path": blob_path,
+                "sha256": sha,
+                "deduplicated": False
+            },
+            req=req
         )
 
     except Exception as e:
         logging.exception("Daily report upload failed")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        return error_response(str(e), 500, req)
 
-def read_pdf_from_blob(project:str,blob_name: str) -> str:
-    blob_service = BlobServiceClient.from_connection_string(os.getenv("AZURE_STORAGE_CONNECTION_STRING"))
-    full_blob_path = f"{project}/{blob_name}"
-    blob_client = blob_service.get_blob_client(container=os.getenv("BLOB_CONTAINER_NAME"), blob=full_blob_path)
-    logging.info(blob_name)
-    
-    stream = io.BytesIO()
-    blob_client.download_blob().readinto(stream)
-    
-    text = ""
-    with pdfplumber.open(stream) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() + "\n"
-    return text
+# ---------------- PDF text extraction ----------------
+# Engines take a seekable binary stream and return one text per page.
+# pdfium is the fast default; pdfplumber does full layout analysis and is
+# kept as the high-fidelity fallback for pages that come out empty or look
+# like tables. PDF_ENGINE_<ROUTE> overrides PDF_ENGINE for one route;
+# text read through the derived text cache uses the ingest engine.
+PDF_ENGINE = os.getenv("PDF_ENGINE", "pdfium")
+PDF_FALLBACK_ENGINE = "pdfplumber"
+PDF_TABLE_LINE_RATIO = float(os.getenv("PDF_TABLE_LINE_RATIO", "0.4"))
 
-@app.route(route="contracts/compare", methods=["POST"])
-def compare_reports(req: func.HttpRequest) -> func.HttpResponse:
-    logging.info("Daily-reports comparison triggered")
+PDF_NUMBER_RE = re.compile(r"(?<![A-Za-z])\d+(?:[.,]\d+)*(?![A-Za-z])")
 
-    try:
-        body = req.get_json()
 
-        project = body.get("projectName")
-        files = body.get("files", [])
+def extract_pages_pdfplumber(stream, page_numbers: list | None = None) -> list:
+    stream.seek(0)
+    with pdfplumber.open(stream, pages=page_numbers) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
 
-        if not project or len(files) < 2:
-            return func.HttpResponse(
-                json.dumps({"error": "Project and at least 2 files required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
 
-        file_1, file_2 = files[0], files[1]
+def extract_pages_pdfium(stream) -> list:
+    import pypdfium2 as pdfium
 
-        logging.info(
-            f"Comparing files | Project={project} | File1={file_1} | File2={file_2}"
-        )
-        file_1_text = read_pdf_from_blob(project, file_1)
-        file_2_text = read_pdf_from_blob(project, file_2)
+    if isinstance(stream, mmap.mmap):
+        # pdfium reads memory maps zero-copy through a ctypes view;
+        # open_blob_stream maps copy-on-write so the view can be created
+        source = (ctypes.c_char * len(stream)).from_buffer(stream)
+    else:
+        stream.seek(0)
+        source = stream
 
-        # --- Prompt Engineering ---
-        prompt = f"""
-You are a senior construction contract analyst with expertise in interior construction projects.
+    pdf = None
+    pages = []
 
-Project: {project}
+    try:
+        pdf = pdfium.PdfDocument(source)
+        for i in range(len(pdf)):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            pages.append(textpage.get_text_range().replace("\r\n", "\n").replace("\r", "\n"))
+            textpage.close()
+            page.close()
+    finally:
+        if pdf is not None:
+            pdf.close()
+        # A view left alive (e.g. by a traceback) keeps the map from closing
+        del source
+
+    return pages
+
+
+def extract_pages_pdfminer(stream) -> list:
+    """
+    pdfminer's own line grouping, without pdfplumber's per-character
+    objects on top. Fully raw mode (laparams=None) glues text runs
+    together without separators, which reads badly in prompts.
+    """
+    from pdfminer.converter import TextConverter
+    from pdfminer.layout import LAParams
+    from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+    from pdfminer.pdfpage import PDFPage
 
-Compare the following contracts in a concise, executive-friendly format. For each point, include a citation referring to the section or line in the provided PDF from which the summary is taken.
+    stream.seek(0)
+    resources = PDFResourceManager(caching=True)
+    output = io.StringIO()
+    device = TextConverter(resources, output, laparams=LAParams())
+    interpreter = PDFPageInterpreter(resources, device)
+    pages = []
 
-Instructions:
-1. Start with a **Final Recommendation**: which contract is preferable and why.
-2. Immediately follow with **Reasons** (bullet points, concise).
-3. Present **Key Differences** in a **table format** using the actual file names as headers:
-   | Aspect       | {file_1} | {file_2} |
-   |-------------|-----------|-----------|
-4. Cover the following aspects in the table: Scope, Commercials, Timelines, Risks.
-5. For each bullet point or table entry, reference the PDF section, e.g., "Scope of Work – Section 1" or "Weekly Execution Timeline – Section 3".
-6. Avoid long paragraphs—use bullet points and tables for clarity.
-7. Always reference the actual file names in all sections.
+    try:
+        for page in PDFPage.get_pages(stream):
+            interpreter.process_page(page)
+            pages.append(output.getvalue())
+            output.seek(0)
+            output.truncate()
+    finally:
+        device.close()
 
-Contract 1: {file_1}
-Content:
-{file_1_text}
+    return pages
 
-Contract 2: {file_2}
-Content:
-{file_2_text}
-"""
-
-        completion = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You compare construction contracts."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.2
-        )
 
-        comparison_text = completion.choices[0].message.content
+PDF_ENGINES = {
+    "pdfium": extract_pages_pdfium,
+    "pdfminer": extract_pages_pdfminer,
+    "pdfplumber": extract_pages_pdfplumber,
+}
 
-        logging.info("Comparison generated successfully")
 
-        return func.HttpResponse(
-            json.dumps({
-                "comparison": comparison_text
-            }),
-            status_code=200,
-            mimetype="application/json"
-        )
+def pdf_engine_for(route: str) -> str:
+    return os.getenv(f"PDF_ENGINE_{route.upper()}", PDF_ENGINE)
 
-    except Exception as e:
-        logging.exception("Comparison failed")
 
-        return func.HttpResponse(
-            json.dumps({
-                "error": str(e)
-            }),
-            status_code=500,
-            mimetype="application/json"
-        )
-    
-def read_pdf_from_blob_path(blob_path: str) -> str:
-    blob_service = BlobServiceClient.from_connection_string(
-        os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    )
+def looks_tabular(page_text: str) -> bool:
+    """Most lines carrying three or more numbers reads as a table."""
+    lines = [line for line in page_text.splitlines() if line.strip()]
+    if len(lines) < 5:
+        return False
 
-    container_name = os.getenv("BLOB_CONTAINER_NAME")
-    blob_client = blob_service.get_blob_client(
-        container=container_name,
-        blob=blob_path
-    )
+    numeric = sum(1 for line in lines if len(PDF_NUMBER_RE.findall(line)) >= 3)
+    return numeric / len(lines) >= PDF_TABLE_LINE_RATIO
 
-    stream = io.BytesIO()
-    blob_client.download_blob().readinto(stream)
-    stream.seek(0)
 
-    text = ""
-    with pdfplumber.open(stream) as pdf:
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text += page_text + "\n"
+def extract_pdf_pages(stream, engine: str | None = None) -> list:
+    """
+    Page texts using the requested engine. Pages the engine leaves empty
+    or that look tabular are re-extracted with pdfplumber; if the engine
+    fails outright the whole document falls back.
+    """
+    engine = engine or PDF_ENGINE
+    if engine not in PDF_ENGINES:
+        raise ValueError(f"Unknown PDF engine: {engine}")
 
-    return text
+    if engine == PDF_FALLBACK_ENGINE:
+        return extract_pages_pdfplumber(stream)
 
+    try:
+        pages = PDF_ENGINES[engine](stream)
+    except Exception:
+        logging.exception(f"PDF engine {engine} failed, falling back to {PDF_FALLBACK_ENGINE}")
+        pages = None
 
-def calculate_reporting_week(start_date: str, report_date: str) -> int:
+    # Fall back outside the except block so the failed engine's traceback,
+    # and any buffer views its frames hold, are released first
+    if pages is None:
+        return extract_pages_pdfplumber(stream)
+
+    retry = [
+        i + 1 for i, page_text in enumerate(pages)
+        if not page_text.strip() or looks_tabular(page_text)
+    ]
+    if retry:
+        for page_number, page_text in zip(retry, extract_pages_pdfplumber(stream, retry)):
+            if page_text.strip():
+                pages[page_number - 1] = page_text
+
+    return pages
+
+
+# ---------------- Blob downloads ----------------
+# Blobs up to BLOB_SPILL_THRESHOLD_MB are read into memory. Larger ones are
+# fetched with parallel ranged reads into a temporary file and handed out
+# as a memory map, so peak memory stays around
+# BLOB_DOWNLOAD_CONCURRENCY * BLOB_DOWNLOAD_CHUNK_MB whatever the blob size.
+BLOB_SPILL_THRESHOLD = int(os.getenv("BLOB_SPILL_THRESHOLD_MB", "32")) * 1024 * 1024
+BLOB_DOWNLOAD_CHUNK = int(os.getenv("BLOB_DOWNLOAD_CHUNK_MB", "4")) * 1024 * 1024
+BLOB_DOWNLOAD_CONCURRENCY = int(os.getenv("BLOB_DOWNLOAD_CONCURRENCY", "4"))
+
+
+@contextmanager
+def open_blob_stream(blob_path: str, mapped: bool = True):
+    """
+    Yields a seekable binary stream over the blob's content. Pass
+    mapped=False to get the spill file itself instead of a memory map,
+    for readers such as zipfile that need a full file object.
+    """
+    blob_client = BlobServiceClient.from_connection_string(
+        os.getenv("AZURE_STORAGE_CONNECTION_STRING"),
+        max_single_get_size=BLOB_DOWNLOAD_CHUNK,
+        max_chunk_get_size=BLOB_DOWNLOAD_CHUNK
+    ).get_blob_client(
+        container=os.getenv("BLOB_CONTAINER_NAME"),
+        blob=blob_path
+    )
+
+    downloader = blob_client.download_blob(max_concurrency=BLOB_DOWNLOAD_CONCURRENCY)
+
+    if downloader.size < BLOB_SPILL_THRESHOLD:
+        stream = io.BytesIO()
+        downloader.readinto(stream)
+        stream.seek(0)
+        yield stream
+        return
+
+    logging.info(f"Spilling {blob_path} ({downloader.size} bytes) to disk")
+
+    with tempfile.TemporaryFile() as spill:
+        downloader.readinto(spill)
+        spill.flush()
+
+        if not mapped:
+            spill.seek(0)
+            yield spill
+            return
+
+        # Copy-on-write keeps the file untouched while allowing the
+        # writable buffer views some parsers need
+        with mmap.mmap(spill.fileno(), 0, access=mmap.ACCESS_COPY) as view:
+            yield view
+
+
+def read_pdf_from_blob(project:str,blob_name: str, engine: str | None = None) -> str:
+    full_blob_path = f"{project}/{blob_name}"
+    logging.info(blob_name)
+
+    with open_blob_stream(full_blob_path) as stream:
+        pages = extract_pdf_pages(stream, engine)
+
+    return "".join(page_text + "\n" for page_text in pages)
+
+@app.route(route="contracts/compare", methods=["POST"])
+def compare_reports(req: func.HttpRequest) -> func.HttpResponse:
+    logging.info("Daily-reports comparison triggered")
+
+    try:
+        body = req.get_json()
+
+        project = body.get("projectName")
+        files = body.get("files", [])
+
+        if not project or len(files) < 2:
+            return error_response("Project and at least 2 files required", 400, req)
+
+        file_1, file_2 = files[0], files[1]
+
+        logging.info(
+            f"Comparing files | Project={project} | File1={file_1} | File2={file_2}"
+        )
+        file_1_text = read_document_text(project, f"{project}/{file_1}")
+        file_2_text = read_document_text(project, f"{project}/{file_2}")
+
+        # --- Prompt Engineering ---
+        completion = chat_completion(
+            messages=render_prompt(
+                "compare",
+                project=project,
+                file_1=file_1,
+                file_1_text=file_1_text,
+                file_2=file_2,
+                file_2_text=file_2_text
+            ),
+            temperature=0.2,
+            project=project,
+            prompt_name="compare"
+        )
+
+        comparison_text = completion.choices[0].message.content
+
+        logging.info("Comparison generated successfully")
+
+        return json_response(
+            {
+                "comparison": comparison_text
+            },
+            req=req
+        )
+
+    except LLMBusyError as e:
+        logging.warning("Comparison failed: %s", e)
+        return llm_busy_response(e, req)
+
+    except Exception as e:
+        logging.exception("Comparison failed")
+        return error_response(str(e), 500, req)
+    
+def read_pdf_pages_from_blob_path(blob_path: str, engine: str | None = None) -> list:
+    with open_blob_stream(blob_path) as stream:
+        return extract_pdf_pages(stream, engine)
+
+
+def read_pdf_from_blob_path(blob_path: str, engine: str | None = None) -> str:
+    return "".join(
+        page_text + "\n"
+        for page_text in read_pdf_pages_from_blob_path(blob_path, engine)
+        if page_text
+    )
+
+
+def calculate_reporting_week(start_date: str, report_date: str) -> int:
     start = datetime.strptime(start_date, "%Y-%m-%d")
     report = datetime.strptime(report_date, "%Y-%m-%d")
 
@@ -424,30 +1180,648 @@ def calculate_reporting_week(start_date: str, report_date: str) -> int:
 
     return math.floor(delta_days / 7) + 1
 
+
+# ---------------- Daily report parser ----------------
+DAILY_REPORT_HEADER_PAGES = int(os.getenv("DAILY_REPORT_HEADER_PAGES", "2"))
+DAILY_REPORT_PARSER_VERSION = 2
+
+REPORT_DATE_PATTERNS = [
+    (re.compile(r"\b\d{1,2}-[A-Za-z]{3}-\d{4}\b"), "%d-%b-%Y"),
+    (re.compile(r"\b\d{1,2}\s[A-Za-z]{3}\s\d{4}\b"), "%d %b %Y"),
+    (re.compile(r"\b\d{4}-\d{2}-\d{2}\b"), "%Y-%m-%d"),
+]
+
+WEATHER_RE = re.compile(
+    r"^\s*weather(?:\s+conditions?)?\s*[:\-–]\s*(.+?)\s*$",
+    re.IGNORECASE | re.MULTILINE
+)
+TOTAL_MANPOWER_RE = re.compile(
+    r"\btotal\s+(?:manpower|man\s?power|labou?r|workforce|workers)\s*[:\-–]?\s*(\d{1,5})\b",
+    re.IGNORECASE
+)
+MANPOWER_HEADING_RE = re.compile(
+    r"^(?:manpower|man\s?power|labou?r|workforce|personnel)\b", re.IGNORECASE
+)
+ACTIVITY_HEADING_RE = re.compile(
+    r"^(?:activities|activity|works?\s+(?:done|carried\s+out|completed|in\s+progress)|work\s+progress|progress)\b",
+    re.IGNORECASE
+)
+GENERIC_HEADING_RE = re.compile(r"^[A-Za-z][A-Za-z /&()-]{0,40}:$")
+MANPOWER_COUNT_RE = re.compile(
+    r"^([A-Za-z][A-Za-z .&/()-]*?)\s*[:\-–]?\s+(\d{1,4})\s*(?:nos?\.?|workers|men|persons|pax)?$",
+    re.IGNORECASE
+)
+QUANTITY_RE = re.compile(
+    r"(\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:[.,]\d+)?)\s*(sq\.?\s?m|sqm|m2|m²|sq\.?\s?ft|sft|sqft|rmt|rm|lm|cum|m3|m³|nos?\.?|kg|mt|tons?|m)(?![A-Za-z])",
+    re.IGNORECASE
+)
+LIST_MARKER_RE = re.compile(r"^\s*(?:[•\-\*]|\d{1,3}[.)])\s*")
+THOUSANDS_RE = re.compile(r"^\d{1,3}(?:,\d{3})+(?:\.\d+)?$")
+
+
+def parse_quantity(value: str) -> float:
+    # "1,200" and "1,200.5" use thousands separators; "2,5" is a decimal comma
+    if THOUSANDS_RE.match(value):
+        return float(value.replace(",", ""))
+    return float(value.replace(",", "."))
+
+
 def extract_report_date(report_text: str) -> str | None:
     """
     Extracts date in formats like:
     14-Jan-2026, 14 Jan 2026, 2026-01-14
     """
-    patterns = [
-        r"\b\d{1,2}-[A-Za-z]{3}-\d{4}\b",
-        r"\b\d{1,2}\s[A-Za-z]{3}\s\d{4}\b",
-        r"\b\d{4}-\d{2}-\d{2}\b",
-    ]
-
-    for pattern in patterns:
-        match = re.search(pattern, report_text)
+    for pattern, fmt in REPORT_DATE_PATTERNS:
+        match = pattern.search(report_text)
         if match:
-            raw = match.group(0)
-            for fmt in ("%d-%b-%Y", "%d %b %Y", "%Y-%m-%d"):
-                try:
-                    return datetime.strptime(raw, fmt).strftime("%Y-%m-%d")
-                except:
-                    continue
+            try:
+                return datetime.strptime(match.group(0), fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
 
     return None
 
 
+def iter_section_lines(text: str, classify, marker_re=LIST_MARKER_RE):
+    """
+    Yields (section, line, listed) for each body line of text, with list
+    markers stripped; listed says whether the line had one. classify(line,
+    heading) returns (True, section) for a heading line, which switches
+    to that section (None for one the caller doesn't collect), and
+    (False, None) for body lines.
+    """
+    section = None
+
+    for raw_line in text.splitlines():
+        line = marker_re.sub("", raw_line).strip()
+        if not line:
+            continue
+
+        is_heading, heading_section = classify(line, line.rstrip(":").strip())
+        if is_heading:
+            section = heading_section
+            continue
+
+        yield section, line, len(line) < len(raw_line.strip())
+
+
+def daily_report_heading(line: str, heading: str):
+    if len(heading) <= 40 and MANPOWER_HEADING_RE.match(heading) and not TOTAL_MANPOWER_RE.search(line):
+        return True, "manpower"
+    if len(heading) <= 40 and ACTIVITY_HEADING_RE.match(heading):
+        return True, "activities"
+    if GENERIC_HEADING_RE.match(line):
+        return True, None
+    return False, None
+
+
+def parse_daily_report(pages: list) -> dict:
+    """
+    Pulls typed fields out of the header pages of a daily report:
+    report date, weather, manpower by trade and activities with quantities.
+    Runs once at ingest; fields that can't be found are left empty.
+    """
+    header = "\n".join(pages[:DAILY_REPORT_HEADER_PAGES])
+
+    weather_match = WEATHER_RE.search(header)
+    total_match = TOTAL_MANPOWER_RE.search(header)
+
+    manpower = {}
+    activities = []
+
+    for section, line, _ in iter_section_lines(header, daily_report_heading):
+        if section == "manpower":
+            count_match = MANPOWER_COUNT_RE.match(line)
+            if count_match and not count_match.group(1).lower().startswith("total"):
+                trade = count_match.group(1).strip(" .:-–")
+                manpower[trade] = manpower.get(trade, 0) + int(count_match.group(2))
+
+        elif section == "activities":
+            quantity_match = QUANTITY_RE.search(line)
+            activities.append({
+                "description": line,
+                "quantity": parse_quantity(quantity_match.group(1)) if quantity_match else None,
+                "unit": quantity_match.group(2).lower() if quantity_match else None
+            })
+
+    if total_match:
+        manpower_total = int(total_match.group(1))
+    else:
+        manpower_total = sum(manpower.values()) if manpower else None
+
+    return {
+        "parserVersion": DAILY_REPORT_PARSER_VERSION,
+        "reportDate": extract_report_date(header),
+        "weather": weather_match.group(1) if weather_match else None,
+        "manpower": manpower,
+        "manpowerTotal": manpower_total,
+        "activities": activities
+    }
+
+
+def daily_report_record_path(project: str, file_name: str) -> str:
+    return derived_blob_path(project, "records", f"{file_name}.json")
+
+
+def save_daily_report_record(project: str, file_name: str, record: dict):
+    get_blob_client(daily_report_record_path(project, file_name)).upload_blob(
+        json.dumps(record, separators=(",", ":")),
+        overwrite=True,
+        content_settings=ContentSettings(content_type="application/json")
+    )
+
+
+def load_daily_report_record(project: str, file_name: str) -> dict | None:
+    try:
+        raw = get_blob_client(
+            daily_report_record_path(project, file_name)
+        ).download_blob().readall()
+    except ResourceNotFoundError:
+        return None
+
+    record = json.loads(raw)
+    if record.get("parserVersion") != DAILY_REPORT_PARSER_VERSION:
+        return None
+    return record
+
+
+def render_daily_report_record(record: dict) -> str:
+    """
+    Compact text form of a parsed record, used in prompts in place of the
+    full report text.
+    """
+    lines = [f"Report date: {record.get('reportDate') or 'unknown'}"]
+
+    if record.get("weather"):
+        lines.append(f"Weather: {record['weather']}")
+    if record.get("manpowerTotal") is not None:
+        trades = ", ".join(f"{k} {v}" for k, v in record.get("manpower", {}).items())
+        lines.append(f"Manpower: {record['manpowerTotal']}" + (f" ({trades})" if trades else ""))
+
+    lines.append("Activities:")
+    lines.extend(f"- {a['description']}" for a in record.get("activities", []))
+
+    return "\n".join(lines)
+
+
+# ---------------- Anomaly store ----------------
+ANOMALY_STORE_BACKEND = os.getenv("ANOMALY_STORE_BACKEND", "sqlite")
+ANOMALY_DB_PATH = os.getenv(
+    "ANOMALY_DB_PATH",
+    os.path.join(tempfile.gettempdir(), "anomalies.db")
+)
+ANOMALY_TABLE_PREFIX = os.getenv("ANOMALY_TABLE_PREFIX", "anomaly")
+IMPACT_LEVELS = ("High", "Medium", "Low")
+
+ANOMALY_BULLET_RE = re.compile(r"^\s*[•\-\*]\s*")
+ANOMALY_IMPACT_RE = re.compile(r"\b(High|Medium|Low)\b", re.IGNORECASE)
+
+
+def get_blob_etag(blob_path: str) -> str:
+    return get_blob_client(blob_path).get_blob_properties().etag
+
+
+def anomaly_result_key(project: str, report_blob: str, report_etag: str,
+                       sow_blob: str, sow_etag: str, reporting_week: int) -> str:
+    """
+    Stable key for one anomaly run: the same report and SOW versions
+    evaluated for the same reporting week always map to the same key.
+    """
+    raw = "\n".join([
+        project, report_blob, report_etag, sow_blob, sow_etag, str(reporting_week)
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def parse_anomaly_rows(anomaly_report: str) -> list:
+    """
+    Parses `• Category | Expected | Observed | Impact: High` bullets.
+    Lines that don't follow the format (including the "no deviations"
+    sentence) are skipped.
+    """
+    rows = []
+
+    for line in anomaly_report.splitlines():
+        if "|" not in line:
+            continue
+
+        parts = [p.strip() for p in ANOMALY_BULLET_RE.sub("", line).split("|")]
+        if len(parts) < 4:
+            continue
+
+        impact_match = ANOMALY_IMPACT_RE.search(parts[-1])
+        if not impact_match:
+            continue
+
+        rows.append({
+            "category": parts[0],
+            "expected": parts[1],
+            "observed": " | ".join(parts[2:-1]),
+            "impact": impact_match.group(1).capitalize()
+        })
+
+    return rows
+
+
+class SqliteAnomalyStore:
+    """Local anomaly store backed by a single SQLite file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS anomaly_results (
+                    key TEXT PRIMARY KEY,
+                    project TEXT NOT NULL,
+                    report_blob TEXT NOT NULL,
+                    report_etag TEXT NOT NULL,
+                    sow_blob TEXT NOT NULL,
+                    sow_etag TEXT NOT NULL,
+                    reporting_week INTEGER NOT NULL,
+                    report_date TEXT,
+                    anomalies TEXT NOT NULL,
+                    created_at TEXT NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS anomaly_rows (
+                    result_key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    project TEXT NOT NULL,
+                    reporting_week INTEGER NOT NULL,
+                    report_date TEXT,
+                    report_blob TEXT NOT NULL,
+                    category TEXT,
+                    expected TEXT,
+                    observed TEXT,
+                    impact TEXT NOT NULL,
+                    PRIMARY KEY (result_key, position)
+                );
+                CREATE INDEX IF NOT EXISTS ix_anomaly_rows_week
+                    ON anomaly_rows (project, reporting_week);
+                CREATE INDEX IF NOT EXISTS ix_anomaly_rows_impact
+                    ON anomaly_rows (project, impact, reporting_week);
+                CREATE INDEX IF NOT EXISTS ix_anomaly_rows_report
+                    ON anomaly_rows (project, report_blob);
+                CREATE TABLE IF NOT EXISTS anomaly_current (
+                    project TEXT NOT NULL,
+                    report_blob TEXT NOT NULL,
+                    result_key TEXT NOT NULL,
+                    PRIMARY KEY (project, report_blob)
+                );
+            """)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def save(self, result: dict, rows: list):
+        with self._connect() as conn:
+            # Rows from earlier runs on the same report (older report or SOW
+            # versions, another start date) are superseded by this one
+            conn.execute(
+                "DELETE FROM anomaly_rows WHERE project = ? AND report_blob = ?",
+                (result["project"], result["reportBlob"])
+            )
+            conn.execute(
+                """INSERT OR REPLACE INTO anomaly_results
+                   (key, project, report_blob, report_etag, sow_blob, sow_etag,
+                    reporting_week, report_date, anomalies, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    result["key"], result["project"], result["reportBlob"],
+                    result["reportEtag"], result["sowBlob"], result["sowEtag"],
+                    result["reportingWeek"], result["reportDate"],
+                    result["anomalies"], result["createdAt"]
+                )
+            )
+            conn.executemany(
+                """INSERT INTO anomaly_rows
+                   (result_key, position, project, reporting_week, report_date,
+                    report_blob, category, expected, observed, impact)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                [
+                    (
+                        result["key"], i, result["project"], result["reportingWeek"],
+                        result["reportDate"], result["reportBlob"], row["category"],
+                        row["expected"], row["observed"], row["impact"]
+                    )
+                    for i, row in enumerate(rows)
+                ]
+            )
+            conn.execute(
+                """INSERT OR REPLACE INTO anomaly_current (project, report_blob, result_key)
+                   VALUES (?, ?, ?)""",
+                (result["project"], result["reportBlob"], result["key"])
+            )
+
+    def current_key(self, project: str, report_blob: str) -> str | None:
+        """Key of the result whose rows the report currently has."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result_key FROM anomaly_current WHERE project = ? AND report_blob = ?",
+                (project, report_blob)
+            ).fetchone()
+
+        return row["result_key"] if row else None
+
+    def get(self, project: str, key: str) -> dict | None:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM anomaly_results WHERE key = ? AND project = ?",
+                (key, project)
+            ).fetchone()
+
+        if not row:
+            return None
+
+        return {
+            "key": row["key"],
+            "project": row["project"],
+            "reportBlob": row["report_blob"],
+            "reportEtag": row["report_etag"],
+            "sowBlob": row["sow_blob"],
+            "sowEtag": row["sow_etag"],
+            "reportingWeek": row["reporting_week"],
+            "reportDate": row["report_date"],
+            "anomalies": row["anomalies"],
+            "createdAt": row["created_at"]
+        }
+
+    def query(self, project: str, from_week: int | None = None,
+              to_week: int | None = None, impacts: list | None = None) -> list:
+        sql = "SELECT * FROM anomaly_rows WHERE project = ?"
+        params = [project]
+
+        if from_week is not None:
+            sql += " AND reporting_week >= ?"
+            params.append(from_week)
+        if to_week is not None:
+            sql += " AND reporting_week <= ?"
+            params.append(to_week)
+        if impacts:
+            sql += f" AND impact IN ({', '.join('?' for _ in impacts)})"
+            params.extend(impacts)
+
+        sql += " ORDER BY reporting_week, report_date, result_key, position"
+
+        with self._connect() as conn:
+            return [
+                {
+                    "reportingWeek": row["reporting_week"],
+                    "reportDate": row["report_date"],
+                    "reportBlob": row["report_blob"],
+                    "category": row["category"],
+                    "expected": row["expected"],
+                    "observed": row["observed"],
+                    "impact": row["impact"]
+                }
+                for row in conn.execute(sql, params)
+            ]
+
+
+class TableAnomalyStore:
+    """Production anomaly store backed by Azure Table Storage."""
+
+    def __init__(self, conn_str: str, prefix: str):
+        from azure.data.tables import TableServiceClient
+
+        service = TableServiceClient.from_connection_string(conn_str)
+        self.results = service.create_table_if_not_exists(f"{prefix}results")
+        self.rows = service.create_table_if_not_exists(f"{prefix}rows")
+        self.current = service.create_table_if_not_exists(f"{prefix}current")
+
+    @staticmethod
+    def _report_row_key(report_blob: str) -> str:
+        # Blob paths contain "/", which row keys don't allow
+        return hashlib.sha256(report_blob.encode("utf-8")).hexdigest()
+
+    def save(self, result: dict, rows: list):
+        # Row keys lead with the zero-padded week so partition scans come back
+        # in week order and week ranges map to row key ranges
+        row_prefix = f"{result['reportingWeek']:05d}-{result['key']}"
+
+        # Rows from earlier runs on the same report (older report or SOW
+        # versions, another start date) are superseded by this one
+        for entity in self.rows.query_entities(
+            "PartitionKey eq @project and ReportBlob eq @report",
+            parameters={
+                "project": result["project"],
+                "report": result["reportBlob"]
+            },
+            select=["PartitionKey", "RowKey"]
+        ):
+            self.rows.delete_entity(entity["PartitionKey"], entity["RowKey"])
+
+        self.results.upsert_entity({
+            "PartitionKey": result["project"],
+            "RowKey": result["key"],
+            "ReportBlob": result["reportBlob"],
+            "ReportEtag": result["reportEtag"],
+            "SowBlob": result["sowBlob"],
+            "SowEtag": result["sowEtag"],
+            "ReportingWeek": result["reportingWeek"],
+            "ReportDate": result["reportDate"],
+            "Anomalies": result["anomalies"],
+            "CreatedAt": result["createdAt"]
+        })
+
+        for i, row in enumerate(rows):
+            self.rows.upsert_entity({
+                "PartitionKey": result["project"],
+                "RowKey": f"{row_prefix}-{i:04d}",
+                "ReportingWeek": result["reportingWeek"],
+                "ReportDate": result["reportDate"],
+                "ReportBlob": result["reportBlob"],
+                "Category": row["category"],
+                "Expected": row["expected"],
+                "Observed": row["observed"],
+                "Impact": row["impact"]
+            })
+
+        self.current.upsert_entity({
+            "PartitionKey": result["project"],
+            "RowKey": self._report_row_key(result["reportBlob"]),
+            "ReportBlob": result["reportBlob"],
+            "ResultKey": result["key"]
+        })
+
+    def current_key(self, project: str, report_blob: str) -> str | None:
+        """Key of the result whose rows the report currently has."""
+        try:
+            entity = self.current.get_entity(project, self._report_row_key(report_blob))
+        except ResourceNotFoundError:
+            return None
+
+        return entity["ResultKey"]
+
+    def get(self, project: str, key: str) -> dict | None:
+        try:
+            entity = self.results.get_entity(project, key)
+        except ResourceNotFoundError:
+            return None
+
+        return {
+            "key": entity["RowKey"],
+            "project": entity["PartitionKey"],
+            "reportBlob": entity["ReportBlob"],
+            "reportEtag": entity["ReportEtag"],
+            "sowBlob": entity["SowBlob"],
+            "sowEtag": entity["SowEtag"],
+            "reportingWeek": entity["ReportingWeek"],
+            "reportDate": entity.get("ReportDate"),
+            "anomalies": entity["Anomalies"],
+            "createdAt": entity["CreatedAt"]
+        }
+
+    def query(self, project: str, from_week: int | None = None,
+              to_week: int | None = None, impacts: list | None = None) -> list:
+        query_filter = "PartitionKey eq @project"
+        params = {"project": project}
+
+        if from_week is not None:
+            query_filter += " and RowKey ge @lo"
+            params["lo"] = f"{from_week:05d}-"
+        if to_week is not None:
+            query_filter += " and RowKey lt @hi"
+            params["hi"] = f"{to_week + 1:05d}-"
+        if impacts:
+            clauses = []
+            for i, impact in enumerate(impacts):
+                clauses.append(f"Impact eq @impact{i}")
+                params[f"impact{i}"] = impact
+            query_filter += f" and ({' or '.join(clauses)})"
+
+        return [
+            {
+                "reportingWeek": entity["ReportingWeek"],
+                "reportDate": entity.get("ReportDate"),
+                "reportBlob": entity["ReportBlob"],
+                "category": entity.get("Category"),
+                "expected": entity.get("Expected"),
+                "observed": entity.get("Observed"),
+                "impact": entity["Impact"]
+            }
+            for entity in self.rows.query_entities(query_filter, parameters=params)
+        ]
+
+
+_anomaly_store = None
+
+
+def get_anomaly_store():
+    global _anomaly_store
+
+    if _anomaly_store is None:
+        if ANOMALY_STORE_BACKEND == "table":
+            _anomaly_store = TableAnomalyStore(
+                os.getenv("AZURE_STORAGE_CONNECTION_STRING"),
+                ANOMALY_TABLE_PREFIX
+            )
+        else:
+            _anomaly_store = SqliteAnomalyStore(ANOMALY_DB_PATH)
+
+    return _anomaly_store
+
+
+def compute_daily_report_anomalies(project: str, daily_report_file: str,
+                                    final_sow_file: str, start_date: str) -> dict:
+    """
+    Anomaly result for one daily report against the final SOW. A stored
+    result for the same report and SOW versions and reporting week is
+    returned without calling the model; "precomputed" says which it was.
+    """
+    daily_report_blob = f"daily-reports/{project}/{daily_report_file}"
+    final_sow_blob = f"{project}/{final_sow_file}"
+
+    daily_report_etag = get_blob_etag(daily_report_blob)
+    final_sow_etag = get_blob_etag(final_sow_blob)
+
+    # ---------- EXTRACT REPORT DATE ----------
+    record = load_daily_report_record(project, daily_report_file)
+    daily_report_date = record.get("reportDate") if record else None
+    daily_report_text = None
+
+    if not daily_report_date:
+        daily_report_text = read_document_text(project, daily_report_blob)
+        daily_report_date = extract_report_date(daily_report_text)
+
+    if not daily_report_date:
+        raise ValueError("Could not extract Daily Report date from document")
+
+    # ---------- CALCULATE REPORTING WEEK ----------
+    reporting_week = calculate_reporting_week(
+        start_date=start_date,
+        report_date=daily_report_date
+    )
+
+    key = anomaly_result_key(
+        project, daily_report_blob, daily_report_etag,
+        final_sow_blob, final_sow_etag, reporting_week
+    )
+
+    try:
+        stored = get_anomaly_store().get(project, key)
+    except Exception:
+        logging.exception("Failed to read stored anomaly result")
+        stored = None
+
+    if stored:
+        # A run with another SOW or start date may have replaced this
+        # report's rows since; put this result's rows back
+        try:
+            store = get_anomaly_store()
+            if store.current_key(project, daily_report_blob) != key:
+                store.save(stored, parse_anomaly_rows(stored["anomalies"]))
+        except Exception:
+            logging.exception("Failed to restore stored anomaly rows")
+
+        return {**stored, "precomputed": True}
+
+    # ---------- READ DOCUMENTS ----------
+    if daily_report_text is None:
+        daily_report_text = read_document_text(project, daily_report_blob)
+
+    final_sow_text = read_document_text(project, final_sow_blob)
+
+    # ---------- 🔥 DYNAMIC PROMPT ----------
+    completion = chat_completion(
+        messages=render_prompt(
+            "anomaly",
+            project=project,
+            final_sow_text=final_sow_text,
+            start_date=start_date,
+            report_date=daily_report_date,
+            reporting_week=reporting_week,
+            daily_report_text=daily_report_text
+        ),
+        temperature=0.1,
+        project=project,
+        prompt_name="anomaly"
+    )
+
+    anomaly_report = completion.choices[0].message.content
+
+    # ---------- PERSIST RESULT ----------
+    result = {
+        "key": key,
+        "project": project,
+        "reportBlob": daily_report_blob,
+        "reportEtag": daily_report_etag,
+        "sowBlob": final_sow_blob,
+        "sowEtag": final_sow_etag,
+        "reportingWeek": reporting_week,
+        "reportDate": daily_report_date,
+        "anomalies": anomaly_report,
+        "createdAt": datetime.utcnow().isoformat()
+    }
+
+    try:
+        get_anomaly_store().save(result, parse_anomaly_rows(anomaly_report))
+    except Exception:
+        # The caller still gets their answer if the store is unavailable
+        logging.exception("Failed to persist anomaly result")
+
+    return {**result, "precomputed": False}
 
 
 @app.route(route="daily-reports/anomaly-detect", methods=["POST"])
@@ -464,99 +1838,152 @@ def detect_daily_report_anomalies(req: func.HttpRequest) -> func.HttpResponse:
         daily_report_file = files[0]
         final_sow_file = files[1]
 
-        # ---------- READ DOCUMENTS ----------
-        daily_report_text_full = read_pdf_from_blob_path(
-            f"daily-reports/{project}/{daily_report_file}"
+        # Fills in settings the project doesn't have yet so the next uploaded
+        # report is checked in the background; an ad-hoc check against another
+        # SOW or start date doesn't replace what PUT /settings chose
+        try:
+            save_project_settings(
+                project, only_missing=True, finalSowFile=final_sow_file, startDate=start_date
+            )
+        except Exception:
+            logging.exception("Failed to record project settings")
+
+        result = compute_daily_report_anomalies(
+            project, daily_report_file, final_sow_file, start_date
+        )
+
+        return json_response(
+            {
+                "anomalies": result["anomalies"],
+                "reportingWeek": result["reportingWeek"],
+                "reportDate": result["reportDate"],
+                "precomputed": result["precomputed"]
+            },
+            req=req
         )
 
-        final_sow_text = read_pdf_from_blob(project, final_sow_file)
+    except LLMBusyError as e:
+        logging.warning("Anomaly detection failed: %s", e)
+        return llm_busy_response(e, req)
 
-        # ---------- EXTRACT REPORT DATE ----------
-        daily_report_date = extract_report_date(daily_report_text_full)
+    except Exception as e:
+        logging.exception("Anomaly detection failed")
+        return error_response(str(e), 500, req)
 
-        if not daily_report_date:
-            raise ValueError("Could not extract Daily Report date from document")
 
-        # ---------- CALCULATE REPORTING WEEK ----------
-        reporting_week = calculate_reporting_week(
-            start_date=start_date,
-            report_date=daily_report_date
+@app.blob_trigger(
+    arg_name="client",
+    path="%BLOB_CONTAINER_NAME%/daily-reports/{project}/{name}",
+    connection="AZURE_STORAGE_CONNECTION_STRING"
+)
+def precompute_daily_report_anomalies(client: blob_bindings.BlobClient):
+    """Check a newly landed daily report so the dashboard finds a stored result."""
+    # Bound as a BlobClient so the worker never downloads the report itself;
+    # compute_daily_report_anomalies reads it through the spill-aware path
+    blob_path = client.blob_name
+    parts = blob_path.split("/")
+
+    if len(parts) != 3 or not parts[2].lower().endswith(".pdf"):
+        return
+
+    _, project, file_name = parts
+    settings = load_project_settings(project)
+
+    if not settings.get("finalSowFile") or not settings.get("startDate"):
+        logging.info(f"Skipping anomaly precompute for {project}: no final SOW or start date set")
+        return
+
+    try:
+        result = compute_daily_report_anomalies(
+            project, file_name, settings["finalSowFile"], settings["startDate"]
         )
+    except (ValueError, ResourceNotFoundError):
+        # Undatable report or a SOW that no longer exists; retrying won't help
+        logging.exception(f"Anomaly precompute skipped for {blob_path}")
+        return
+
+    # LLMBusyError and storage errors propagate so the runtime retries the trigger
+    logging.info(
+        f"Anomalies for {blob_path} ready (week {result['reportingWeek']}, "
+        f"{'already stored' if result['precomputed'] else 'computed'})"
+    )
 
-        daily_report_text = daily_report_text_full
-        # ---------- 🔥 DYNAMIC PROMPT ----------
-        prompt = f"""
-You are a senior construction controls and contract compliance analyst.
 
-Project: {project}
+@app.route(
+    route="projects/{projectName}/settings",
+    methods=["GET", "PUT"],
+    auth_level=func.AuthLevel.ANONYMOUS
+)
+def project_settings(req: func.HttpRequest) -> func.HttpResponse:
+    """Read or update the final SOW and start date used for background anomaly checks."""
+    try:
+        project_name = req.route_params.get("projectName")
 
-CONTEXT (AUTHORITATIVE):
-- Project start date: {start_date}
-- Daily report date: {daily_report_date}
-- Calculated reporting week: Week {reporting_week}
+        if not project_name:
+            return error_response("projectName required", 400, req)
 
-STRICT EVALUATION RULES:
-1. Only assess activities that were contractually scheduled
-   to START or PROGRESS in Week {reporting_week} or earlier.
-2. Any activity scheduled AFTER Week {reporting_week}:
-   - MUST be Impact: Low
-   - Use wording: "Not yet due as per contract timeline"
-3. Medium or High impact is allowed ONLY if:
-   - The activity was due by Week {reporting_week}
-   - AND the Daily Report shows a clear deviation
-4. Payment-related deviations:
-   - Medium impact ONLY if the linked physical milestone
-     was due by Week {reporting_week}
-   - Otherwise Impact: Low
+        if req.method == "GET":
+            return json_response(
+                {"project": project_name, **load_project_settings(project_name)},
+                req=req
+            )
 
-OUTPUT FORMAT (MANDATORY — UI DEPENDS ON THIS):
-• Category | Expected | Observed | Impact: High / Medium / Low
+        body = req.get_json()
+        changes = {k: body.get(k) for k in PROJECT_SETTING_KEYS if body.get(k)}
 
-STYLE RULES:
-- One bullet per deviation
-- Short, factual statements only
-- No explanations
-- No headings
-- No extra text before or after bullets
+        if not changes:
+            return error_response(f"One of {', '.join(PROJECT_SETTING_KEYS)} required", 400, req)
 
-FINAL SOW (Baseline):
-{final_sow_text}
+        if "startDate" in changes:
+            try:
+                datetime.strptime(changes["startDate"], "%Y-%m-%d")
+            except (TypeError, ValueError):
+                return error_response("startDate must be YYYY-MM-DD", 400, req)
 
-DAILY REPORT (Week {reporting_week}):
-{daily_report_text}
+        settings = save_project_settings(project_name, **changes)
 
-If NO valid deviations exist, respond with EXACTLY:
-No deviations detected for the current reporting period.
-"""
-
-        completion = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You detect construction compliance anomalies."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1
-        )
+        return json_response({"project": project_name, **settings}, req=req)
 
-        anomaly_report = completion.choices[0].message.content
+    except Exception as e:
+        logging.exception("Project settings update failed")
+        return error_response(str(e), 500, req)
 
-        return func.HttpResponse(
-            json.dumps({
-                "anomalies": anomaly_report,
-                "reportingWeek": reporting_week,
-                "reportDate": daily_report_date
-            }),
-            status_code=200,
-            mimetype="application/json"
-        )
+
+@app.route(
+    route="daily-reports/{projectName}/anomalies",
+    methods=["GET"],
+    auth_level=func.AuthLevel.ANONYMOUS
+)
+def query_daily_report_anomalies(req: func.HttpRequest) -> func.HttpResponse:
+    """Return stored anomaly rows for a project, filtered by week range and impact level."""
+    try:
+        project_name = req.route_params.get("projectName")
+
+        if not project_name:
+            return error_response("projectName required", 400, req)
+
+        try:
+            from_week = int(req.params["fromWeek"]) if req.params.get("fromWeek") else None
+            to_week = int(req.params["toWeek"]) if req.params.get("toWeek") else None
+        except ValueError:
+            return error_response("fromWeek and toWeek must be integers", 400, req)
+
+        impacts = [
+            i.strip().capitalize()
+            for i in req.params.get("impact", "").split(",")
+            if i.strip()
+        ]
+        unknown = [i for i in impacts if i not in IMPACT_LEVELS]
+        if unknown:
+            return error_response(f"impact must be one of {', '.join(IMPACT_LEVELS)}", 400, req)
+
+        rows = get_anomaly_store().query(project_name, from_week, to_week, impacts)
+
+        return json_response({"project": project_name, "anomalies": rows}, req=req)
 
     except Exception as e:
-        logging.exception("Anomaly detection failed")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
+        logging.exception("Failed to query anomalies")
+        return error_response(str(e), 500, req)
 
 
 @app.route(route="document-chat", methods=["POST"])
@@ -569,73 +1996,149 @@ def document_chat(req: func.HttpRequest) -> func.HttpResponse:
         project = body.get("projectName")
         file_name = body.get("fileName")
         question = body.get("question")
+        scope = body.get("scope", "file")
+
+        if scope == "project":
+            if not project or not question:
+                return error_response("Both 'projectName' and 'question' are required.", 400, req)
+            return project_chat(req, project, question)
 
         if not file_name or not question:
-            return func.HttpResponse(
-                json.dumps({"error": "Both 'fileName' and 'question' are required."}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("Both 'fileName' and 'question' are required.", 400, req)
 
         # Read the PDF content from blob
         blob_path = f"{project}/{file_name}"
-        file_text = read_pdf_from_blob(project, file_name)
+        file_text = read_document_text(project, blob_path)
 
         # ---------- 🔥 NEW PROMPT (CHAT BASED ON DOCUMENT) ----------
-        prompt = f"""
-You are a senior construction project assistant with expert knowledge in reading and analyzing construction project documents. 
+        completion = chat_completion(
+            messages=render_prompt(
+                "document_chat",
+                project=project,
+                file_name=file_name,
+                file_text=file_text,
+                question=question
+            ),
+            temperature=0.1,
+            project=project,
+            prompt_name="document_chat"
+        )
 
-Project: {project}
+        answer = completion.choices[0].message.content
+        logging.info(f"Document chat response: {answer}")
 
-TASK:
-Answer the user's question based ONLY on the content of the provided document.
-Do NOT provide any information that is not in the document.
-If the question requires analysis or recommendations (e.g., vendor selection), base your reasoning strictly on the document content.
+        return json_response({"answer": answer}, req=req)
 
-DOCUMENT: {file_name}
-Content:
-{file_text}
+    except LLMBusyError as e:
+        logging.warning("Document chat failed: %s", e)
+        return llm_busy_response(e, req)
 
-USER QUESTION:
-{question}
+    except Exception as e:
+        logging.exception("Document chat failed")
 
-RESPONSE REQUIREMENTS:
-- Be precise, factual, and detailed.
-- Summarize content when asked for a summary.
-- If asked for recommendations (e.g., which vendor to choose), provide reasoning strictly based on the document's information.
-- Keep your answer concise but comprehensive.
-- If the answer is not in the document, respond with:
-  "The document does not contain information to answer this question."
-"""
-
-        # Call the OpenAI chat model
-        completion = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You answer user questions based on provided documents."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1
+        return error_response(str(e), 500, req)
+    
+
+def project_chat(req: func.HttpRequest, project: str, question: str) -> func.HttpResponse:
+    """Answers a question from the best-matching passages across the whole project."""
+    index, _ = load_search_index(project)
+    hits = load_passage_texts(project, index, search_project(index, question))
+
+    if not hits:
+        return json_response(
+            {
+                "answer": "The project documents do not contain information to answer this question.",
+                "sources": []
+            },
+            req=req
         )
 
-        answer = completion.choices[0].message.content
-        logging.info(f"Document chat response: {answer}")
+    passages = "\n\n".join(
+        f"[{hit['file']}, page {hit['page']}]\n{hit['text']}"
+        for hit in hits
+    )
+
+    completion = chat_completion(
+        messages=render_prompt(
+            "project_chat",
+            project=project,
+            passages=passages,
+            question=question
+        ),
+        temperature=0.1,
+        project=project,
+        prompt_name="project_chat"
+    )
+
+    return json_response(
+        {
+            "answer": completion.choices[0].message.content,
+            "sources": [
+                {"file": hit["file"], "page": hit["page"], "score": hit["score"]}
+                for hit in hits
+            ]
+        },
+        req=req
+    )
+
 
-        return func.HttpResponse(
-            json.dumps({"answer": answer}),
-            status_code=200,
-            mimetype="application/json"
+@app.route(
+    route="projects/{projectName}/search",
+    methods=["GET"],
+    auth_level=func.AuthLevel.ANONYMOUS
+)
+def search_project_documents(req: func.HttpRequest) -> func.HttpResponse:
+    """Return the best-matching passages across all documents in a project."""
+    try:
+        project_name = req.route_params.get("projectName")
+        query = req.params.get("q")
+
+        if not project_name or not query:
+            return error_response("projectName and q required", 400, req)
+
+        try:
+            top_k = int(req.params.get("top", SEARCH_TOP_K))
+        except ValueError:
+            return error_response("top must be an integer", 400, req)
+
+        index, _ = load_search_index(project_name)
+        hits = load_passage_texts(project_name, index, search_project(index, query, top_k))
+
+        return json_response(
+            {
+                "project": project_name,
+                "results": [
+                    {"file": h["file"], "page": h["page"], "score": h["score"], "text": h["text"]}
+                    for h in hits
+                ]
+            },
+            req=req
         )
 
     except Exception as e:
-        logging.exception("Document chat failed")
+        logging.exception("Project search failed")
+        return error_response(str(e), 500, req)
+
+
+@app.route(
+    route="projects/{projectName}/warmup",
+    methods=["POST"],
+    auth_level=func.AuthLevel.ANONYMOUS
+)
+def warm_up_project_documents(req: func.HttpRequest) -> func.HttpResponse:
+    """Prefetch and parse a project's documents; call again until "done" to track readiness."""
+    try:
+        project_name = req.route_params.get("projectName")
+
+        if not project_name:
+            return error_response("projectName required", 400, req)
+
+        return json_response(warm_up_project(project_name), req=req)
+
+    except Exception as e:
+        logging.exception("Project warm-up failed")
+        return error_response(str(e), 500, req)
 
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
-    
 
 @app.route(
     route="projects/{projectName}/files",
@@ -647,111 +2150,606 @@ def delete_file(req: func.HttpRequest) -> func.HttpResponse:
         project_name = req.route_params.get("projectName")
         file_name = req.params.get("fileName")
 
-        if not project_name or not file_name:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName and fileName required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+        if not project_name or not file_name:
+            return error_response("projectName and fileName required", 400, req)
+
+        conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        container_name = os.getenv("BLOB_CONTAINER_NAME")
+
+        blob_service = BlobServiceClient.from_connection_string(conn_str)
+        container_client = blob_service.get_container_client(container_name)
+
+        blob_path = f"{project_name}/{file_name}"
+        blob_client = container_client.get_blob_client(blob_path)
+
+        blob_client.delete_blob()
+
+        try:
+            unindex_document(project_name, blob_path)
+            delete_document_pages(project_name, blob_path)
+            unrecord_content_hash(project_name, blob_path)
+        except Exception:
+            logging.exception(f"Failed to clean up derived data for {blob_path}")
+
+        return json_response({"message": f"{file_name} deleted successfully"}, req=req)
+
+    except Exception as e:
+        logging.exception("Failed to delete file")
+        return error_response(str(e), 500, req)
+    
+
+@app.route(
+    route="projects/{projectName}/files/meta",
+    methods=["GET"],
+    auth_level=func.AuthLevel.ANONYMOUS
+)
+def list_project_files_with_metadata(req: func.HttpRequest) -> func.HttpResponse:
+    """Return a list of files in the given project with metadata (last_modified/upload date, size, content type, metadata)."""
+    try:
+        project_name = req.route_params.get("projectName")
+ 
+        if not project_name:
+            return error_response("projectName required", 400, req)
+ 
+        conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+        container_name = os.getenv("BLOB_CONTAINER_NAME")
+ 
+        blob_service = BlobServiceClient.from_connection_string(conn_str)
+        container_client = blob_service.get_container_client(container_name)
+ 
+        files = []
+        prefix = f"daily-reports/{project_name}/"
+ 
+        for blob in container_client.list_blobs(name_starts_with=prefix):
+            # blob.name is the full path in the container
+            file_name = blob.name.replace(prefix, "")
+            if not file_name:
+                # skip directory-like blobs
+                continue
+ 
+            # last_modified is a timezone-aware datetime if present
+            last_modified = None
+            if getattr(blob, "last_modified", None):
+                try:
+                    last_modified = blob.last_modified.isoformat()
+                except Exception:
+                    last_modified = str(blob.last_modified)
+ 
+            size = getattr(blob, "size", None)
+ 
+            content_type = None
+            if getattr(blob, "content_settings", None):
+                content_type = getattr(blob.content_settings, "content_type", None)
+ 
+            files.append({
+                "name": file_name,
+                "last_modified": last_modified,
+                "content_type": content_type,
+            })
+ 
+        return json_response(files, req=req)
+ 
+    except Exception as e:
+        logging.exception("Failed to list project files with metadata")
+        return error_response(str(e), 500, req)
+
+def get_blob_client(blob_path: str):
+    return BlobServiceClient.from_connection_string(
+        os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    ).get_blob_client(
+        container=os.getenv("BLOB_CONTAINER_NAME"),
+        blob=blob_path
+    )
+
+
+def get_container_client():
+    return BlobServiceClient.from_connection_string(
+        os.getenv("AZURE_STORAGE_CONNECTION_STRING")
+    ).get_container_client(os.getenv("BLOB_CONTAINER_NAME"))
+
+
+# Artifacts derived from uploaded documents live under their own root so
+# they never show up in project or daily-report file listings
+DERIVED_PREFIX = "_derived"
+
+
+def derived_blob_path(project: str, kind: str, name: str) -> str:
+    return f"{DERIVED_PREFIX}/{project}/{kind}/{name}"
+
+
+# Compressed derived blobs are stored as opaque application/gzip payloads.
+# With Content-Encoding: gzip the SDK would inflate the body on download
+# and gzip.decompress would then fail on plain JSON.
+GZIP_CONTENT_SETTINGS = ContentSettings(content_type="application/gzip")
+
+
+def download_gzip_blob(blob_client):
+    """Returns (decompressed bytes, etag) of a gzip payload blob."""
+    # decompress=False also covers blobs written with the encoding header
+    downloader = blob_client.download_blob(decompress=False)
+    return gzip.decompress(downloader.readall()), downloader.properties.etag
+
+
+def load_json_blob(blob_path: str, compressed: bool = False):
+    """
+    Returns (data, etag); ({}, None) when the blob does not exist yet.
+    compressed reads a gzip payload blob (see download_gzip_blob).
+    """
+    try:
+        if compressed:
+            raw, etag = download_gzip_blob(get_blob_client(blob_path))
+        else:
+            downloader = get_blob_client(blob_path).download_blob()
+            raw, etag = downloader.readall(), downloader.properties.etag
+    except ResourceNotFoundError:
+        return {}, None
+
+    return json.loads(raw), etag
+
+
+def update_json_blob(blob_path: str, mutate, compressed: bool = False, attempts: int = 5) -> dict:
+    """
+    Read-modify-write of a JSON blob, conditional on the ETag that was
+    read so concurrent writers retry instead of overwriting each other.
+    """
+    blob_client = get_blob_client(blob_path)
+
+    if compressed:
+        content_settings = GZIP_CONTENT_SETTINGS
+    else:
+        content_settings = ContentSettings(content_type="application/json")
+
+    for _ in range(attempts):
+        data, etag = load_json_blob(blob_path, compressed)
+        mutate(data)
+
+        encoded = json.dumps(data, separators=(",", ":")).encode("utf-8")
+        if compressed:
+            encoded = gzip.compress(encoded)
+
+        try:
+            if etag:
+                blob_client.upload_blob(
+                    encoded,
+                    overwrite=True,
+                    etag=etag,
+                    match_condition=MatchConditions.IfNotModified,
+                    content_settings=content_settings
+                )
+            else:
+                blob_client.upload_blob(encoded, overwrite=False, content_settings=content_settings)
+            return data
+        except (ResourceModifiedError, ResourceExistsError):
+            logging.info(f"{blob_path} changed concurrently, retrying")
+
+    raise RuntimeError(f"Could not update {blob_path}")
+
+
+# ---------------- Document text cache ----------------
+def document_text_cache_path(project: str, blob_path: str) -> str:
+    return derived_blob_path(project, "text", f"{blob_path}.json.gz")
+
+
+def save_document_pages(project: str, blob_path: str, etag: str, pages: list):
+    get_blob_client(document_text_cache_path(project, blob_path)).upload_blob(
+        gzip.compress(json.dumps({"etag": etag, "pages": pages}).encode("utf-8")),
+        overwrite=True,
+        content_settings=GZIP_CONTENT_SETTINGS,
+        # Lets a listing tell which source version each cache entry holds
+        metadata={"sourceetag": etag}
+    )
+
+
+def list_cached_text_etags(project: str) -> dict:
+    """Blob path -> source ETag of every text cache entry of the project."""
+    prefix = derived_blob_path(project, "text", "")
+
+    return {
+        blob.name[len(prefix):-len(".json.gz")]: (blob.metadata or {}).get("sourceetag")
+        for blob in get_container_client().list_blobs(name_starts_with=prefix, include=["metadata"])
+        if blob.name.endswith(".json.gz")
+    }
+
+
+def load_document_pages(project: str, blob_path: str, etag: str | None = None) -> list:
+    """
+    Page texts for a document, from the derived text cache when it was
+    built from the current blob version, otherwise extracted and cached.
+    """
+    if etag is None:
+        etag = get_blob_etag(blob_path)
+
+    try:
+        data, _ = download_gzip_blob(get_blob_client(document_text_cache_path(project, blob_path)))
+        cached = json.loads(data)
+        if cached.get("etag") == etag:
+            return cached["pages"]
+    except ResourceNotFoundError:
+        pass
+
+    pages = read_pdf_pages_from_blob_path(blob_path, pdf_engine_for("ingest"))
+    save_document_pages(project, blob_path, etag, pages)
+    return pages
+
+
+def read_document_text(project: str, blob_path: str) -> str:
+    """Full text of a document, through the derived text cache."""
+    return "".join(page_text + "\n" for page_text in load_document_pages(project, blob_path))
+
+
+def delete_document_pages(project: str, blob_path: str):
+    try:
+        get_blob_client(document_text_cache_path(project, blob_path)).delete_blob()
+    except ResourceNotFoundError:
+        pass
+
+
+# ---------------- Upload deduplication ----------------
+# Uploads are hashed while they stream into a spool file. A per-project
+# index maps SHA-256 -> the blob that already holds those bytes, recorded
+# with the ETag it had, so an overwritten or deleted blob never counts as
+# a match. A client that sends X-Content-SHA256 can skip the body when
+# the content is already stored.
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_KB", "1024")) * 1024
+UPLOAD_SPOOL_MAX_BYTES = int(os.getenv("UPLOAD_SPOOL_MAX_MB", "16")) * 1024 * 1024
+CONTENT_HASH_HEADER = "X-Content-SHA256"
+SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def spool_upload(stream):
+    """Copy an upload into a spooled temp file, hashing it chunk by chunk."""
+    digest = hashlib.sha256()
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_BYTES)
+
+    for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+        digest.update(chunk)
+        spool.write(chunk)
+
+    size = spool.tell()
+    spool.seek(0)
+    return spool, digest.hexdigest(), size
+
+
+def client_content_hash(req: func.HttpRequest):
+    """Lower-case hex SHA-256 the client declared, or None; ValueError if malformed."""
+    value = req.headers.get(CONTENT_HASH_HEADER) or req.form.get("sha256")
+    if not value:
+        return None
+
+    value = value.strip().lower()
+    if not SHA256_RE.match(value):
+        raise ValueError(f"{CONTENT_HASH_HEADER} must be a hex SHA-256 digest")
+    return value
+
+
+def content_hash_index_path(project: str) -> str:
+    return derived_blob_path(project, "uploads", "hashes.json")
+
+
+def load_content_hash_index(project: str):
+    return load_json_blob(content_hash_index_path(project))
+
+
+def update_content_hash_index(project: str, mutate):
+    update_json_blob(content_hash_index_path(project), mutate)
+
+
+def forget_content_hash(index: dict, blob_path: str):
+    for sha in list(index):
+        index[sha] = [entry for entry in index[sha] if entry["path"] != blob_path]
+        if not index[sha]:
+            del index[sha]
+
+
+def record_content_hash(project: str, sha: str, blob_path: str, etag: str):
+    def apply(index: dict):
+        forget_content_hash(index, blob_path)
+        index.setdefault(sha, []).append({"path": blob_path, "etag": etag})
+
+    update_content_hash_index(project, apply)
+
+
+def unrecord_content_hash(project: str, blob_path: str):
+    update_content_hash_index(project, lambda index: forget_content_hash(index, blob_path))
+
+
+def find_duplicate_upload(project: str, sha: str, prefix: str):
+    """
+    Path of a blob under prefix that still holds exactly these bytes, or
+    None. Entries whose blob has since changed or disappeared are ignored.
+    """
+    index, _ = load_content_hash_index(project)
+
+    for entry in index.get(sha, []):
+        if not entry["path"].startswith(prefix):
+            continue
+        try:
+            if get_blob_etag(entry["path"]) == entry["etag"]:
+                return entry["path"]
+        except ResourceNotFoundError:
+            pass
+
+    return None
+
+
+def deduplicated_response(req: func.HttpRequest, project: str, blob_path: str, sha: str):
+    return json_response(
+        {
+            "success": True,
+            "project": project,
+            "file": blob_path.rsplit("/", 1)[-1],
+            "path": blob_path,
+            "sha256": sha,
+            "deduplicated": True
+        },
+        req=req
+    )
+
+
+def check_upload_hash(req: func.HttpRequest, project: str, prefix: str, file):
+    """
+    Shared front half of the upload routes. Returns (response, upload):
+    response short-circuits the request (duplicate, bad hash, or missing
+    body); otherwise upload is (spool, sha, size) ready to store.
+    """
+    try:
+        declared = client_content_hash(req)
+    except ValueError as e:
+        return error_response(str(e), 400, req), None
+
+    if not file and not declared:
+        return error_response(f"file, or its SHA-256 in {CONTENT_HASH_HEADER}, is required", 400, req), None
+
+    if not file:
+        existing = find_duplicate_upload(project, declared, prefix)
+        if existing:
+            return deduplicated_response(req, project, existing, declared), None
+        return error_response("No stored upload has this content hash; send the file", 404, req), None
+
+    spool, sha, size = spool_upload(file.stream)
+
+    if declared and declared != sha:
+        spool.close()
+        return error_response(f"{CONTENT_HASH_HEADER} does not match the uploaded file", 400, req), None
+
+    existing = find_duplicate_upload(project, sha, prefix)
+    if existing:
+        spool.close()
+        return deduplicated_response(req, project, existing, sha), None
+
+    return None, (spool, sha, size)
+
+
+# ---------------- Project settings ----------------
+# Values that background work needs without a request to carry them: the
+# final SOW daily reports are checked against and the date reporting
+# weeks count from. The UI can set them directly; finalize and the
+# anomaly endpoint record what they were last called with.
+PROJECT_SETTING_KEYS = ("finalSowFile", "startDate")
+
+
+def project_settings_path(project: str) -> str:
+    return derived_blob_path(project, "settings", "project.json")
+
+
+def load_project_settings(project: str) -> dict:
+    return load_json_blob(project_settings_path(project))[0]
+
+
+def save_project_settings(project: str, only_missing: bool = False, **changes) -> dict:
+    """Stores the given settings; with only_missing, keeps any value already set."""
+    changes = {k: v for k, v in changes.items() if k in PROJECT_SETTING_KEYS and v}
+    settings = load_project_settings(project)
+
+    if only_missing:
+        changes = {k: v for k, v in changes.items() if not settings.get(k)}
+
+    if all(settings.get(k) == v for k, v in changes.items()):
+        return settings
+
+    def apply(current: dict):
+        for k, v in changes.items():
+            if not (only_missing and current.get(k)):
+                current[k] = v
+
+    return update_json_blob(project_settings_path(project), apply)
+
+
+# ---------------- Project search index ----------------
+SEARCH_PASSAGE_WORDS = int(os.getenv("SEARCH_PASSAGE_WORDS", "200"))
+SEARCH_TOP_K = int(os.getenv("SEARCH_TOP_K", "8"))
+SEARCH_INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def search_tokens(text: str) -> list:
+    return [t for t in WORD_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def page_passages(page_text: str) -> list:
+    """Splits a page into passages of at most SEARCH_PASSAGE_WORDS words."""
+    words = page_text.split()
+    return [
+        " ".join(words[i:i + SEARCH_PASSAGE_WORDS])
+        for i in range(0, len(words), SEARCH_PASSAGE_WORDS)
+    ]
+
+
+def search_index_path(project: str) -> str:
+    return derived_blob_path(project, "search", "bm25.json.gz")
+
+
+def empty_search_index() -> dict:
+    """
+    Index layout:
+      docs:      blob path -> {"etag", "terms": [...], "passages": [ids]}
+      passages:  id -> [blob path, page number, chunk number, length]
+      postings:  term -> flat [id, tf, id, tf, ...]
+    Each doc keeps its term list so removing it only touches its own
+    postings.
+    """
+    return {
+        "version": SEARCH_INDEX_VERSION,
+        "nextId": 0,
+        "totalLength": 0,
+        "docs": {},
+        "passages": {},
+        "postings": {}
+    }
+
+
+def remove_from_search_index(index: dict, blob_path: str):
+    doc = index["docs"].pop(blob_path, None)
+    if not doc:
+        return
+
+    removed = {str(pid) for pid in doc["passages"]}
+    for pid in removed:
+        index["totalLength"] -= index["passages"].pop(pid)[3]
+
+    for term in doc["terms"]:
+        flat = index["postings"].get(term, [])
+        kept = []
+        for i in range(0, len(flat), 2):
+            if str(flat[i]) not in removed:
+                kept.extend(flat[i:i + 2])
+        if kept:
+            index["postings"][term] = kept
+        else:
+            index["postings"].pop(term, None)
+
+
+def add_to_search_index(index: dict, blob_path: str, etag: str, pages: list):
+    remove_from_search_index(index, blob_path)
+
+    doc_terms = set()
+    passage_ids = []
+
+    for page_number, page_text in enumerate(pages, start=1):
+        for chunk_number, passage in enumerate(page_passages(page_text)):
+            tokens = search_tokens(passage)
+            if not tokens:
+                continue
+
+            pid = index["nextId"]
+            index["nextId"] += 1
+            passage_ids.append(pid)
+            index["passages"][str(pid)] = [blob_path, page_number, chunk_number, len(tokens)]
+            index["totalLength"] += len(tokens)
+
+            counts = {}
+            for token in tokens:
+                counts[token] = counts.get(token, 0) + 1
+            for term, tf in counts.items():
+                index["postings"].setdefault(term, []).extend([pid, tf])
+            doc_terms.update(counts)
+
+    index["docs"][blob_path] = {
+        "etag": etag,
+        "terms": sorted(doc_terms),
+        "passages": passage_ids
+    }
+
+
+def load_search_index(project: str) -> tuple[dict, str | None]:
+    """Returns (index, blob etag); a missing or outdated index comes back empty."""
+    index, etag = load_json_blob(search_index_path(project), compressed=True)
+
+    if index.get("version") != SEARCH_INDEX_VERSION:
+        return empty_search_index(), etag
+
+    return index, etag
+
+
+def update_search_index(project: str, mutate):
+    """
+    Read-modify-write of the project index through update_json_blob, so
+    concurrent uploads retry instead of losing each other's changes.
+    """
+    def apply(index: dict):
+        if index.get("version") != SEARCH_INDEX_VERSION:
+            index.clear()
+            index.update(empty_search_index())
+        mutate(index)
+
+    update_json_blob(search_index_path(project), apply, compressed=True)
+
+
+def index_document(project: str, blob_path: str, etag: str, pages: list):
+    update_search_index(
+        project,
+        lambda index: add_to_search_index(index, blob_path, etag, pages)
+    )
+
+
+def unindex_document(project: str, blob_path: str):
+    update_search_index(
+        project,
+        lambda index: remove_from_search_index(index, blob_path)
+    )
+
+
+def search_project(index: dict, query: str, top_k: int = SEARCH_TOP_K) -> list:
+    """BM25 ranking of passages; returns [{"blob", "page", "chunk", "score"}]."""
+    n_passages = len(index["passages"])
+    if not n_passages:
+        return []
+
+    avg_length = index["totalLength"] / n_passages
+    scores = {}
+
+    for term in set(search_tokens(query)):
+        flat = index["postings"].get(term)
+        if not flat:
+            continue
+
+        df = len(flat) // 2
+        idf = math.log(1 + (n_passages - df + 0.5) / (df + 0.5))
+
+        for i in range(0, len(flat), 2):
+            pid, tf = flat[i], flat[i + 1]
+            length = index["passages"][str(pid)][3]
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[pid] = scores.get(pid, 0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
 
-        conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-        container_name = os.getenv("BLOB_CONTAINER_NAME")
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
 
-        blob_service = BlobServiceClient.from_connection_string(conn_str)
-        container_client = blob_service.get_container_client(container_name)
+    return [
+        {
+            "blob": index["passages"][str(pid)][0],
+            "page": index["passages"][str(pid)][1],
+            "chunk": index["passages"][str(pid)][2],
+            "score": round(score, 4)
+        }
+        for pid, score in ranked
+    ]
 
-        blob_path = f"{project_name}/{file_name}"
-        blob_client = container_client.get_blob_client(blob_path)
 
-        blob_client.delete_blob()
+def project_display_name(project: str, blob_path: str) -> str:
+    """File name as users see it: project files bare, daily reports prefixed."""
+    if blob_path.startswith(f"daily-reports/{project}/"):
+        return "daily-reports/" + blob_path[len(f"daily-reports/{project}/"):]
+    return blob_path[len(f"{project}/"):] if blob_path.startswith(f"{project}/") else blob_path
 
-        return func.HttpResponse(
-            json.dumps({"message": f"{file_name} deleted successfully"}),
-            mimetype="application/json"
-        )
 
-    except Exception as e:
-        logging.exception("Failed to delete file")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
-    
+def load_passage_texts(project: str, index: dict, hits: list) -> list:
+    """Attaches passage text to search hits using the derived text cache."""
+    pages_by_blob = {}
 
-@app.route(
-    route="projects/{projectName}/files/meta",
-    methods=["GET"],
-    auth_level=func.AuthLevel.ANONYMOUS
-)
-def list_project_files_with_metadata(req: func.HttpRequest) -> func.HttpResponse:
-    """Return a list of files in the given project with metadata (last_modified/upload date, size, content type, metadata)."""
-    try:
-        project_name = req.route_params.get("projectName")
- 
-        if not project_name:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName required"}),
-                status_code=400,
-                mimetype="application/json"
+    for hit in hits:
+        blob_path = hit["blob"]
+        if blob_path not in pages_by_blob:
+            pages_by_blob[blob_path] = load_document_pages(
+                project, blob_path, index["docs"][blob_path]["etag"]
             )
- 
-        conn_str = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-        container_name = os.getenv("BLOB_CONTAINER_NAME")
- 
-        blob_service = BlobServiceClient.from_connection_string(conn_str)
-        container_client = blob_service.get_container_client(container_name)
- 
-        files = []
-        prefix = f"daily-reports/{project_name}/"
- 
-        for blob in container_client.list_blobs(name_starts_with=prefix):
-            # blob.name is the full path in the container
-            file_name = blob.name.replace(prefix, "")
-            if not file_name:
-                # skip directory-like blobs
-                continue
- 
-            # last_modified is a timezone-aware datetime if present
-            last_modified = None
-            if getattr(blob, "last_modified", None):
-                try:
-                    last_modified = blob.last_modified.isoformat()
-                except Exception:
-                    last_modified = str(blob.last_modified)
- 
-            size = getattr(blob, "size", None)
- 
-            content_type = None
-            if getattr(blob, "content_settings", None):
-                content_type = getattr(blob.content_settings, "content_type", None)
- 
-            files.append({
-                "name": file_name,
-                "last_modified": last_modified,
-                "content_type": content_type,
-            })
- 
-        return func.HttpResponse(
-            json.dumps(files),
-            mimetype="application/json"
-        )
- 
-    except Exception as e:
-        logging.exception("Failed to list project files with metadata")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
 
-def get_blob_client(blob_path: str):
-    return BlobServiceClient.from_connection_string(
-        os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-    ).get_blob_client(
-        container=os.getenv("BLOB_CONTAINER_NAME"),
-        blob=blob_path
-    )
+        pages = pages_by_blob[blob_path]
+        passages = page_passages(pages[hit["page"] - 1]) if hit["page"] <= len(pages) else []
+        hit["text"] = passages[hit["chunk"]] if hit["chunk"] < len(passages) else ""
+        hit["file"] = project_display_name(project, blob_path)
+
+    return hits
 
 @app.route(route="projects/{projectName}/finalize", methods=["POST"])
 def finalize_document(req: func.HttpRequest) -> func.HttpResponse:
@@ -766,14 +2764,15 @@ def finalize_document(req: func.HttpRequest) -> func.HttpResponse:
     logging.info(f"Finalizing document | Project={project} | File={file_name}")
 
     if not project or not file_name:
-        return func.HttpResponse(
-            json.dumps({"error": "projectName and finalFile required"}),
-            status_code=400,
-            mimetype="application/json"
-        )
+        return error_response("projectName and finalFile required", 400, req)
 
     # 1️⃣ Read final PDF
-    extracted_text = read_pdf_from_blob(project, file_name)
+    extracted_text = read_pdf_from_blob(project, file_name, pdf_engine_for("finalize"))
+
+    try:
+        save_project_settings(project, finalSowFile=file_name)
+    except Exception:
+        logging.exception("Failed to record final SOW in project settings")
 
     payload = {
         "project": project,
@@ -801,7 +2800,7 @@ def finalize_document(req: func.HttpRequest) -> func.HttpResponse:
     ws.append([
         datetime.utcnow().strftime("%Y-%m-%d"),
         "final",
-        json.dumps(payload)
+        json.dumps(offload_payload_content(project, payload))
     ])
 
     wb.save(output)
@@ -815,13 +2814,12 @@ def finalize_document(req: func.HttpRequest) -> func.HttpResponse:
         )
     )
 
-    return func.HttpResponse(
-        json.dumps({
+    return json_response(
+        {
             "success": True,
             "excelPath": excel_path
-        }),
-        status_code=200,
-        mimetype="application/json"
+        },
+        req=req
     )
 
 
@@ -842,6 +2840,603 @@ def normalize_date(value):
     raise ValueError(f"Unsupported date format: {value}")
 
 
+# ---------------- Project warm-up ----------------
+# Opening a project fires a warm-up: every PDF under {project}/ and
+# daily-reports/{project}/ whose cached text or index entry is missing or
+# older than the blob is extracted on a shared, bounded pool. Each call
+# waits up to WARMUP_WAIT_SECONDS, indexes what finished, and reports
+# progress; documents still extracting keep going and are picked up by
+# the next call, so the UI polls until "done".
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_WAIT_SECONDS = float(os.getenv("WARMUP_WAIT_SECONDS", "20"))
+
+warmup_executor = ThreadPoolExecutor(max_workers=WARMUP_CONCURRENCY, thread_name_prefix="warmup")
+_warmup_futures = {}
+_warmup_lock = threading.Lock()
+
+
+def submit_warmup(project: str, blob_path: str, etag: str):
+    """One extraction per blob version, however many warm-up calls ask for it."""
+    key = (blob_path, etag)
+    with _warmup_lock:
+        future = _warmup_futures.get(key)
+        if future is None or (future.done() and future.exception() is not None):
+            future = warmup_executor.submit(load_document_pages, project, blob_path, etag)
+            _warmup_futures[key] = future
+        return future
+
+
+def list_project_pdfs(project: str) -> dict:
+    """Blob path -> ETag for every PDF of the project, daily reports included."""
+    container_client = get_container_client()
+
+    blobs = {}
+    for prefix in (f"{project}/", f"daily-reports/{project}/"):
+        for blob in container_client.list_blobs(name_starts_with=prefix):
+            if blob.name.lower().endswith(".pdf"):
+                blobs[blob.name] = blob.etag
+
+    return blobs
+
+
+def warm_up_project(project: str) -> dict:
+    blobs = list_project_pdfs(project)
+    index, _ = load_search_index(project)
+    cached = list_cached_text_etags(project)
+
+    # Stale when either derived artifact is missing or built from another version
+    stale = {
+        blob_path: etag for blob_path, etag in blobs.items()
+        if index["docs"].get(blob_path, {}).get("etag") != etag
+        or cached.get(blob_path) != etag
+    }
+    removed = [blob_path for blob_path in index["docs"] if blob_path not in blobs]
+
+    futures = {
+        blob_path: submit_warmup(project, blob_path, etag)
+        for blob_path, etag in stale.items()
+    }
+    if futures:
+        wait(futures.values(), timeout=WARMUP_WAIT_SECONDS)
+
+    finished = {}
+    failed = []
+    for blob_path, future in futures.items():
+        if not future.done():
+            continue
+        if future.exception() is not None:
+            logging.warning(f"Warm-up failed for {blob_path}: {future.exception()}")
+            failed.append(project_display_name(project, blob_path))
+        else:
+            finished[blob_path] = future.result()
+
+    if finished or removed:
+        def apply(index: dict):
+            for blob_path in removed:
+                remove_from_search_index(index, blob_path)
+            for blob_path, pages in finished.items():
+                add_to_search_index(index, blob_path, stale[blob_path], pages)
+
+        update_search_index(project, apply)
+
+        with _warmup_lock:
+            for blob_path in finished:
+                _warmup_futures.pop((blob_path, stale[blob_path]), None)
+
+    ready = len(blobs) - len(stale) + len(finished)
+
+    return {
+        "project": project,
+        "total": len(blobs),
+        "ready": ready,
+        "pending": len(stale) - len(finished) - len(failed),
+        "failed": failed,
+        "done": ready + len(failed) == len(blobs)
+    }
+
+
+# ---------------- Progress series ----------------
+PROGRESS_RESOLUTIONS = ("day", "week", "month")
+PROGRESS_ENCODINGS = ("points", "changes")
+
+
+def build_progress_changes(progress_map: dict, start: date) -> tuple[list, list]:
+    """
+    Collapses a {date: progress} map into parallel arrays of change points.
+    Entries before the project start are ignored, and a point is only kept
+    when the progress value actually changes.
+    """
+    dates = []
+    values = []
+    last_progress = 0
+
+    for day in sorted(d for d in progress_map if d >= start):
+        progress = progress_map[day]
+        if progress == last_progress:
+            continue
+        dates.append(day)
+        values.append(progress)
+        last_progress = progress
+
+    return dates, values
+
+
+def progress_on(change_dates: list, change_values: list, day: date):
+    """
+    Cumulative progress in effect on the given day (0 before the first change).
+    """
+    idx = bisect_right(change_dates, day)
+    return change_values[idx - 1] if idx else 0
+
+
+def progress_bucket(day: date, resolution: str, origin: date) -> date:
+    """
+    First day of the bucket that contains `day`. Weeks are counted from
+    `origin`; months are calendar months, clamped so no bucket starts
+    before `origin`.
+    """
+    if resolution == "week":
+        return origin + timedelta(days=((day - origin).days // 7) * 7)
+
+    if resolution == "month":
+        return max(day.replace(day=1), origin)
+
+    return day
+
+
+def next_progress_bucket(bucket: date, resolution: str) -> date:
+    if resolution == "week":
+        return bucket + timedelta(days=7)
+
+    if resolution == "month":
+        if bucket.month == 12:
+            return date(bucket.year + 1, 1, 1)
+        return date(bucket.year, bucket.month + 1, 1)
+
+    return bucket + timedelta(days=1)
+
+
+def progress_series_points(change_dates: list, change_values: list,
+                           range_start: date, range_end: date,
+                           resolution: str) -> list:
+    """
+    One {"date", "progress"} point per bucket between range_start and
+    range_end. Each bucket reports the progress in effect on its last day.
+    """
+    points = []
+    bucket = range_start
+
+    while bucket <= range_end:
+        following = next_progress_bucket(bucket, resolution)
+        bucket_end = min(following - timedelta(days=1), range_end)
+
+        points.append({
+            "date": bucket.strftime("%Y-%m-%d"),
+            "progress": progress_on(change_dates, change_values, bucket_end)
+        })
+
+        bucket = following
+
+    return points
+
+
+def progress_series_changes(change_dates: list, change_values: list,
+                            range_start: date, range_end: date,
+                            resolution: str) -> dict:
+    """
+    Run-length form of progress_series_points: parallel arrays holding the
+    first bucket and every bucket whose value differs from the one before.
+    Each value holds until the next date in the array. Work is proportional
+    to the number of progress changes, not to the length of the range.
+    """
+    dates = [range_start]
+    values = [progress_on(change_dates, change_values, range_start)]
+
+    # A bucket reports its last change, so the first bucket can already
+    # move past the value on range_start
+    lo = bisect_right(change_dates, range_start)
+    hi = bisect_right(change_dates, range_end)
+
+    for day, progress in zip(change_dates[lo:hi], change_values[lo:hi]):
+        bucket = progress_bucket(day, resolution, range_start)
+        if bucket == dates[-1]:
+            values[-1] = progress
+        else:
+            dates.append(bucket)
+            values.append(progress)
+
+    # Drop buckets that ended up with the same value as their predecessor
+    compact_dates = [dates[0]]
+    compact_values = [values[0]]
+    for day, progress in zip(dates[1:], values[1:]):
+        if progress != compact_values[-1]:
+            compact_dates.append(day)
+            compact_values.append(progress)
+
+    return {
+        "dates": [d.strftime("%Y-%m-%d") for d in compact_dates],
+        "progress": compact_values
+    }
+
+
+# ---------------- Progress estimation ----------------
+PROGRESS_FEATURE_DIM = 1 << 12
+PROGRESS_MATCH_HIGH = float(os.getenv("PROGRESS_MATCH_HIGH", "0.55"))
+PROGRESS_MATCH_LOW = float(os.getenv("PROGRESS_MATCH_LOW", "0.3"))
+PROGRESS_CONFIDENCE_THRESHOLD = float(os.getenv("PROGRESS_CONFIDENCE_THRESHOLD", "0.7"))
+PROGRESS_LLM_BATCH_SIZE = int(os.getenv("PROGRESS_LLM_BATCH_SIZE", "5"))
+# Part of the cached-answer fingerprint; bump when the activity list the
+# model is shown changes for the same final report
+PROGRESS_ESTIMATOR_VERSION = 2
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "the and for with from into onto that this are was were has have been all any per "
+    "of to in on at by as or be is it an a".split()
+)
+
+
+def report_payload(data) -> dict:
+    """
+    Decoded final-report.xlsx data cell. Cells written before payloads
+    were JSON encoded come back as {"content": <cell text>}.
+    """
+    try:
+        payload = json.loads(data)
+    except (TypeError, ValueError):
+        return {"content": str(data or "")}
+
+    if not isinstance(payload, dict):
+        return {"content": str(data)}
+
+    return payload
+
+
+def payload_content(payload: dict) -> str:
+    """Row content, read from its payload blob on first use for out-of-line rows."""
+    if payload.get("content") is not None:
+        return payload["content"]
+
+    if payload.get("contentRef"):
+        return load_payload_content(payload["project"], payload["contentRef"])
+
+    return ""
+
+
+def payload_fingerprint_source(payload: dict) -> str:
+    """What identifies a row's content without fetching it: the content hash when stored out of line."""
+    return payload.get("contentRef") or payload_content(payload)
+
+
+def activity_lines(text: str) -> list:
+    """Candidate activity lines from free text, without list markers or duplicates."""
+    seen = set()
+    lines = []
+
+    for raw_line in text.splitlines():
+        line = LIST_MARKER_RE.sub("", raw_line).strip()
+        if len(line) < 8 or len(line) > 200 or not any(c.isalpha() for c in line):
+            continue
+
+        key = line.lower()
+        if key not in seen:
+            seen.add(key)
+            lines.append(line)
+
+    return lines
+
+
+# Final report (SOW) structure: work items sit under a scope / works /
+# BOQ heading; commercial sections (payment, retention, LDs, ...) are
+# skipped. Clause numbers such as "1.2" count as list markers here.
+WORK_SECTION_RE = re.compile(
+    r"^(?:(?:detailed\s+)?scope(?:\s+of\s+(?:the\s+)?works?)?|works?(?:\s+(?:items?|packages?|description))?"
+    r"|schedule\s+of\s+works?|bill\s+of\s+quantities(?:\s*\(boq\))?|boq|(?:list\s+of\s+)?activities"
+    r"|deliverables|work\s+breakdown(?:\s+structure)?)(?:\s*[-–:(].*)?$",
+    re.IGNORECASE
+)
+NON_WORK_SECTION_RE = re.compile(
+    r"^(?:payments?(?:\s+(?:terms|schedule|milestones))?|terms(?:\s+(?:and|&)\s+conditions)?"
+    r"|(?:general\s+|special\s+)?conditions(?:\s+of\s+contract)?|retention(?:\s+money)?"
+    r"|liquidated\s+damages|lds?|penalt(?:y|ies)|defects?\s+liability(?:\s+period)?|warrant(?:y|ies)"
+    r"|insurances?|variations?|definitions|contract\s+(?:sum|price|value)|price|taxes|dispute\s+resolution"
+    r"|termination|bank\s+guarantees?|performance\s+(?:bond|security)|advance(?:\s+payment)?"
+    r"|mobili[sz]ation(?:\s+advance)?|notices|signatures?|exclusions|assumptions)(?:\s*[-–:(].*)?$",
+    re.IGNORECASE
+)
+SOW_ITEM_MARKER_RE = re.compile(r"^\s*(?:[•\-\*]|\(?[a-z]\)|\d{1,3}(?:\.\d{1,3})*[.)]?(?=\s))\s*", re.IGNORECASE)
+
+
+def final_report_heading(line: str, heading: str):
+    if len(heading) > 60:
+        return False, None
+
+    short = len(heading.split()) <= 6
+    if short and WORK_SECTION_RE.match(heading):
+        return True, "works"
+    if short and NON_WORK_SECTION_RE.match(heading):
+        return True, "other"
+    if GENERIC_HEADING_RE.match(line) or (heading.isupper() and any(c.isalpha() for c in heading)):
+        return True, None
+    return False, None
+
+
+def final_report_work_items(text: str) -> list:
+    """
+    The final report's work items: lines under its scope / works / BOQ
+    headings. Without such a heading, numbered or bulleted lines and
+    lines with a quantity outside commercial sections; without those,
+    every candidate line.
+    """
+    works = []
+    enumerated = []
+
+    for section, line, listed in iter_section_lines(text, final_report_heading, SOW_ITEM_MARKER_RE):
+        if section == "works":
+            works.append(line)
+        elif section != "other" and (listed or QUANTITY_RE.search(line)):
+            enumerated.append(line)
+
+    for candidates in (works, enumerated):
+        items = activity_lines("\n".join(candidates))
+        if items:
+            return items
+
+    return activity_lines(text)
+
+
+def hashed_features(lines: list) -> np.ndarray:
+    """
+    Hashed character trigram counts (per word, space padded), one row per
+    line. Trigrams tolerate plurals and abbreviations ("corridor" vs
+    "corridors"); crc32 keeps the buckets stable across worker processes.
+    """
+    matrix = np.zeros((len(lines), PROGRESS_FEATURE_DIM), dtype=np.float32)
+    rows = []
+    cols = []
+
+    for i, line in enumerate(lines):
+        tokens = [
+            t for t in WORD_RE.findall(line.lower())
+            if t not in STOPWORDS
+        ]
+        grams = [
+            padded[j:j + 3]
+            for padded in (f" {t} " for t in tokens)
+            for j in range(len(padded) - 2)
+        ]
+        rows.extend([i] * len(grams))
+        cols.extend(zlib.crc32(g.encode("utf-8")) % PROGRESS_FEATURE_DIM for g in grams)
+
+    np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(cols, dtype=np.intp)), 1)
+    return matrix
+
+
+def tfidf_normalize(matrix: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    weighted = matrix * idf
+    norms = np.linalg.norm(weighted, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return weighted / norms
+
+
+def estimate_progress_locally(final_lines: list, daily_entries: list) -> list:
+    """
+    Scores each report date against the final report's activity list.
+
+    daily_entries is a date-sorted list of (date, activity lines). A final
+    activity counts as done once any report so far matches it at or above
+    PROGRESS_MATCH_HIGH, and as half done between the LOW and HIGH marks.
+    A date's confidence is the share of newly matched activities that
+    cleared the HIGH mark, scaled by the share of the date's own lines that
+    match any activity at all: work the list can't place means the local
+    estimate is missing something, so the date goes to the model.
+    """
+    final_counts = hashed_features(final_lines)
+    document_freq = (final_counts > 0).sum(axis=0)
+    idf = np.log((1 + len(final_lines)) / (1 + document_freq)).astype(np.float32) + 1
+    final_vecs = tfidf_normalize(final_counts, idf)
+
+    best = np.zeros(len(final_lines), dtype=np.float32)
+    estimates = []
+
+    for day, lines in daily_entries:
+        if lines:
+            day_vecs = tfidf_normalize(hashed_features(lines), idf)
+            pair_sims = day_vecs @ final_vecs.T
+            sims = pair_sims.max(axis=0)
+            coverage = float((pair_sims.max(axis=1, initial=0) >= PROGRESS_MATCH_LOW).mean())
+        else:
+            sims = np.zeros_like(best)
+            coverage = 1.0
+
+        touched = (sims > best) & (sims >= PROGRESS_MATCH_LOW)
+        ambiguous = touched & (sims < PROGRESS_MATCH_HIGH)
+        best = np.maximum(best, sims)
+
+        done = int((best >= PROGRESS_MATCH_HIGH).sum())
+        partial = int(((best >= PROGRESS_MATCH_LOW) & (best < PROGRESS_MATCH_HIGH)).sum())
+
+        if touched.any():
+            confidence = 1 - float(ambiguous.sum()) / float(touched.sum())
+        else:
+            confidence = 1.0
+        confidence *= coverage
+
+        estimates.append({
+            "date": day,
+            "progress": round(100 * (done + 0.5 * partial) / max(1, len(final_lines)), 1),
+            "confidence": round(confidence, 2)
+        })
+
+    return estimates
+
+
+def progress_fingerprint(final_source: str, day_source: str) -> str:
+    return hashlib.sha256(f"{final_source}\n\x00\n{day_source}".encode("utf-8")).hexdigest()[:32]
+
+
+def load_progress_llm_cache(project: str) -> dict:
+    try:
+        raw = get_blob_client(
+            derived_blob_path(project, "progress", "llm-estimates.json")
+        ).download_blob().readall()
+    except ResourceNotFoundError:
+        return {}
+
+    return json.loads(raw)
+
+
+def save_progress_llm_cache(project: str, cache: dict):
+    get_blob_client(
+        derived_blob_path(project, "progress", "llm-estimates.json")
+    ).upload_blob(
+        json.dumps(cache, separators=(",", ":")),
+        overwrite=True,
+        content_settings=ContentSettings(content_type="application/json")
+    )
+
+
+def parse_llm_json(text: str):
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        text = text[text.index("\n") + 1:] if "\n" in text else text
+    return json.loads(text)
+
+
+def estimate_progress_with_llm(project: str, final_lines: list, batch: list, previous_progress) -> dict:
+    """
+    Asks the model for cumulative progress on a small batch of ambiguous
+    dates. batch holds (date, daily report text, local estimate) tuples.
+    """
+    final_activities = "\n".join(f"- {line}" for line in final_lines)
+    daily_texts = "\n\n".join(
+        f"Date: {day.strftime('%Y-%m-%d')}\nLocal estimate: {local}%\nDaily Report:\n{text}"
+        for day, text, local in batch
+    )
+
+    completion = chat_completion(
+        messages=render_prompt(
+            "progress",
+            final_activities=final_activities,
+            previous_progress=previous_progress,
+            daily_texts=daily_texts
+        ),
+        temperature=0,
+        project=project,
+        prompt_name="progress"
+    )
+
+    return {
+        datetime.fromisoformat(item["date"]).date(): item["progress"]
+        for item in parse_llm_json(completion.choices[0].message.content)
+    }
+
+
+def estimate_progress(project: str, final_report_data, daily_reports: list) -> tuple[dict, dict]:
+    """
+    Hybrid progress estimate for date-sorted final-report.xlsx daily rows.
+
+    Dates scored locally with enough confidence are used as is. The rest
+    go to the model in batches of PROGRESS_LLM_BATCH_SIZE, and the answers
+    are cached per date against a fingerprint of the final report and
+    that date's reports, so later refreshes only pay for new or changed
+    days. Returns ({date: progress}, {"local": n, "llm": n, "cached": n}).
+    """
+    final_payload = report_payload(final_report_data)
+    final_text = payload_content(final_payload)
+    final_lines = final_report_work_items(final_text)
+    final_source = f"v{PROGRESS_ESTIMATOR_VERSION}:{payload_fingerprint_source(final_payload)}"
+
+    # Group rows by date; several reports can land on the same day. Row
+    # content is only fetched when the parsed record has no activities or
+    # the day ends up going to the model.
+    grouped = {}
+    for row in daily_reports:
+        payload = report_payload(row["data"])
+        record = payload.get("record")
+        if record and record.get("activities"):
+            lines = [a["description"] for a in record["activities"]]
+        else:
+            lines = activity_lines(payload_content(payload))
+
+        entry = grouped.setdefault(row["normalized_date"], {"lines": [], "payloads": []})
+        entry["lines"].extend(lines)
+        entry["payloads"].append(payload)
+
+    days = sorted(grouped)
+    estimates = estimate_progress_locally(
+        final_lines, [(day, grouped[day]["lines"]) for day in days]
+    )
+
+    cache = load_progress_llm_cache(project)
+    progress_map = {}
+    pending = []
+    counts = {"local": 0, "llm": 0, "cached": 0}
+
+    for estimate in estimates:
+        day = estimate["date"]
+        day_key = day.strftime("%Y-%m-%d")
+
+        if estimate["confidence"] >= PROGRESS_CONFIDENCE_THRESHOLD:
+            progress_map[day] = estimate["progress"]
+            counts["local"] += 1
+            continue
+
+        fingerprint = progress_fingerprint(final_source, json.dumps([
+            [p.get("record"), payload_fingerprint_source(p)]
+            for p in grouped[day]["payloads"]
+        ], sort_keys=True))
+        cached = cache.get(day_key)
+        if cached and cached["fingerprint"] == fingerprint:
+            progress_map[day] = cached["progress"]
+            counts["cached"] += 1
+        else:
+            day_text = "\n\n".join(
+                daily_report_prompt_text(p) for p in grouped[day]["payloads"]
+            )
+            pending.append((day, day_text, estimate["progress"], fingerprint))
+
+    for i in range(0, len(pending), PROGRESS_LLM_BATCH_SIZE):
+        batch = pending[i:i + PROGRESS_LLM_BATCH_SIZE]
+        previous = [p for d, p in progress_map.items() if d < batch[0][0]]
+        answers = estimate_progress_with_llm(
+            project,
+            final_lines,
+            [(day, text, local) for day, text, local, _ in batch],
+            max(previous, default=0)
+        )
+
+        for day, _, local, fingerprint in batch:
+            progress = answers.get(day, local)
+            progress_map[day] = progress
+            cache[day.strftime("%Y-%m-%d")] = {"fingerprint": fingerprint, "progress": progress}
+            counts["llm"] += 1
+
+    if pending:
+        save_progress_llm_cache(project, cache)
+
+    # Mixed sources can disagree; cumulative progress never goes down
+    running = 0
+    for day in days:
+        running = max(running, progress_map[day])
+        progress_map[day] = running
+
+    return progress_map, counts
+
+
+def daily_report_prompt_text(payload: dict) -> str:
+    """
+    Prompt text for a final-report.xlsx daily report row: the parsed record
+    when ingest found activities, otherwise the report content.
+    """
+    record = payload.get("record")
+    if record and record.get("activities"):
+        return render_daily_report_record(record)
+
+    return payload_content(payload)
+
+
 @app.route(route="projects/{projectName}/progress-chart", methods=["GET"])
 def generate_progress_chart(req: func.HttpRequest) -> func.HttpResponse:
     logging.info("Generating project progress chart")
@@ -849,35 +3444,38 @@ def generate_progress_chart(req: func.HttpRequest) -> func.HttpResponse:
     try:
         project_name = req.route_params.get("projectName")
         start_date_str = req.params.get("startDate")
+        from_str = req.params.get("from")
+        to_str = req.params.get("to")
+        resolution = req.params.get("resolution", "day").lower()
+        encoding = req.params.get("encoding", "points").lower()
 
         if not project_name:
-            return func.HttpResponse(
-                json.dumps({"error": "projectName is required"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("projectName is required", 400, req)
 
         if not start_date_str:
-            return func.HttpResponse(
-                json.dumps({"error": "startDate is required (YYYY-MM-DD)"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("startDate is required (YYYY-MM-DD)", 400, req)
+
+        if resolution not in PROGRESS_RESOLUTIONS:
+            return error_response(f"resolution must be one of {', '.join(PROGRESS_RESOLUTIONS)}", 400, req)
 
-        project_start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+        if encoding not in PROGRESS_ENCODINGS:
+            return error_response(f"encoding must be one of {', '.join(PROGRESS_ENCODINGS)}", 400, req)
+
+        try:
+            project_start_date = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+            range_from = datetime.strptime(from_str, "%Y-%m-%d").date() if from_str else None
+            range_to = datetime.strptime(to_str, "%Y-%m-%d").date() if to_str else None
+        except ValueError:
+            return error_response("startDate, from and to must be YYYY-MM-DD", 400, req)
 
         # ---------- Download final report ----------
         excel_path = f"daily-reports/{project_name}/final-report.xlsx"
-        blob_client = get_blob_client(excel_path)
-
-        stream = io.BytesIO()
-        blob_client.download_blob().readinto(stream)
-        stream.seek(0)
 
-        wb = load_workbook(stream)
-        ws = wb.active
+        with open_blob_stream(excel_path, mapped=False) as stream:
+            wb = load_workbook(stream, read_only=True)
+            rows = list(wb.active.iter_rows(values_only=True))
+            wb.close()
 
-        rows = list(ws.iter_rows(values_only=True))
         headers = [h.lower() for h in rows[0]]
         data_rows = rows[1:]
 
@@ -895,92 +3493,55 @@ def generate_progress_chart(req: func.HttpRequest) -> func.HttpResponse:
                 final_report_data = row_dict.get("data")
 
         if not daily_reports:
-            return func.HttpResponse(
-                json.dumps({"error": "No daily reports found"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("No daily reports found", 400, req)
 
         if not final_report_data:
-            return func.HttpResponse(
-                json.dumps({"error": "No final report found"}),
-                status_code=400,
-                mimetype="application/json"
-            )
+            return error_response("No final report found", 400, req)
 
         # ---------- Sort daily reports ----------
         daily_reports.sort(key=lambda x: x["normalized_date"])
 
-        # ---------- Prepare LLM Prompt ----------
-        daily_texts = "\n\n".join([
-            f"Date: {d['normalized_date'].strftime('%Y-%m-%d')}\nDaily Report:\n{d['data']}"
-            for d in daily_reports
-        ])
-
-        prompt = f"""
-You are a senior construction project analyst.
-
-FINAL REPORT:
-{final_report_data}
-
-DAILY REPORTS:
-{daily_texts}
-
-TASK:
-For each daily report, compare the activities with the FINAL report and estimate cumulative progress.
-
-Return ONLY valid JSON in this format:
-[
-  {{"date": "YYYY-MM-DD", "progress": number}}
-]
-"""
-
-        completion = client.chat.completions.create(
-            model=DEPLOYMENT_NAME,
-            messages=[
-                {"role": "system", "content": "You analyze construction project progress."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0
+        # ---------- Estimate progress ----------
+        progress_map, estimated_by = estimate_progress(
+            project_name, final_report_data, daily_reports
         )
 
-        llm_response = completion.choices[0].message.content.strip()
-        llm_data = json.loads(llm_response)
-
-        # ---------- Build progress map ----------
-        progress_map = {
-            datetime.fromisoformat(item["date"]).date(): item["progress"]
-            for item in llm_data
-        }
-
-        # ---------- Fill missing dates from project start ----------
-        end_date = daily_reports[-1]["normalized_date"]
-        current_date = project_start_date
-
-        chart_data = []
-        last_progress = 0
-
-        while current_date <= end_date:
-            if current_date in progress_map:
-                last_progress = progress_map[current_date]
+        # ---------- Build series over the requested range ----------
+        change_dates, change_values = build_progress_changes(
+            progress_map, project_start_date
+        )
 
-            chart_data.append({
-                "date": current_date.strftime("%Y-%m-%d"),
-                "progress": last_progress
-            })
+        range_start = max(project_start_date, range_from or project_start_date)
+        range_end = daily_reports[-1]["normalized_date"]
+        if range_to:
+            range_end = min(range_end, range_to)
 
-            current_date += timedelta(days=1)
+        if range_start > range_end:
+            chart_data = {"dates": [], "progress": []} if encoding == "changes" else []
+        elif encoding == "changes":
+            chart_data = progress_series_changes(
+                change_dates, change_values, range_start, range_end, resolution
+            )
+        else:
+            chart_data = progress_series_points(
+                change_dates, change_values, range_start, range_end, resolution
+            )
 
-        return func.HttpResponse(
-            json.dumps({"project": project_name,"chartData": chart_data}),
-            status_code=200,
-            mimetype="application/json"
+        return json_response(
+            {
+                "project": project_name,
+                "resolution": resolution,
+                "encoding": encoding,
+                "estimatedBy": estimated_by,
+                "chartData": chart_data
+            },
+            req=req
         )
 
+    except LLMBusyError as e:
+        logging.warning("Failed to generate progress chart: %s", e)
+        return llm_busy_response(e, req)
+
     except Exception as e:
         logging.exception("Failed to generate progress chart")
-        return func.HttpResponse(
-            json.dumps({"error": str(e)}),
-            status_code=500,
-            mimetype="application/json"
-        )
\ No newline at end of file
+        return error_response(str(e), 500, req)
\ No newline at end of file
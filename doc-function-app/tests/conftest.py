@@ -0,0 +1,124 @@
+import gzip
+import os
+import sys
+from itertools import count
+from types import SimpleNamespace
+
+import pytest
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+
+# function_app builds its OpenAI client at import time; nothing here calls it
+for name, value in (
+    ("ENDPOINT_URL", "https://localhost"),
+    ("AZURE_OPENAI_API_KEY", "test"),
+    ("DEPLOYMENT_NAME", "test"),
+    ("AZURE_STORAGE_CONNECTION_STRING", "UseDevelopmentStorage=true"),
+    ("BLOB_CONTAINER_NAME", "test"),
+):
+    os.environ.setdefault(name, value)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import function_app  # noqa: E402
+
+
+class FakeDownloader:
+    def __init__(self, data: bytes, etag: str):
+        self._data = data
+        self.size = len(data)
+        self.properties = type("Properties", (), {"etag": etag})()
+
+    def readall(self) -> bytes:
+        return self._data
+
+    def readinto(self, stream) -> int:
+        stream.write(self._data)
+        return self.size
+
+
+class FakeBlobClient:
+    """
+    In-memory stand-in for azure.storage.blob.BlobClient. Like the SDK,
+    download_blob() inflates bodies stored with Content-Encoding: gzip
+    unless called with decompress=False.
+    """
+
+    def __init__(self, store: "FakeBlobStore", blob_path: str):
+        self.store = store
+        self.blob_path = blob_path
+
+    def upload_blob(self, data, overwrite=False, etag=None, match_condition=None,
+                    content_settings=None, metadata=None, **kwargs):
+        if hasattr(data, "read"):
+            data = data.read()
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+
+        current = self.store.blobs.get(self.blob_path)
+        if current and not overwrite:
+            raise ResourceExistsError(self.blob_path)
+        if match_condition == MatchConditions.IfNotModified and (not current or current["etag"] != etag):
+            raise ResourceModifiedError(self.blob_path)
+
+        blob = {
+            "data": bytes(data),
+            "etag": f'"{next(self.store.etags)}"',
+            "content_encoding": getattr(content_settings, "content_encoding", None),
+            "metadata": dict(metadata or {})
+        }
+        self.store.blobs[self.blob_path] = blob
+        return {"etag": blob["etag"]}
+
+    def download_blob(self, decompress=True, **kwargs):
+        blob = self._get()
+        data = blob["data"]
+        if decompress and blob["content_encoding"] == "gzip":
+            data = gzip.decompress(data)
+        return FakeDownloader(data, blob["etag"])
+
+    def get_blob_properties(self):
+        return type("Properties", (), {"etag": self._get()["etag"]})()
+
+    def delete_blob(self):
+        self._get()
+        del self.store.blobs[self.blob_path]
+
+    def _get(self) -> dict:
+        if self.blob_path not in self.store.blobs:
+            raise ResourceNotFoundError(self.blob_path)
+        return self.store.blobs[self.blob_path]
+
+
+class FakeBlobStore:
+    def __init__(self):
+        self.blobs = {}
+        self.etags = count(1)
+
+    def client(self, blob_path: str) -> FakeBlobClient:
+        return FakeBlobClient(self, blob_path)
+
+    def container(self) -> "FakeBlobStore":
+        return self
+
+    def list_blobs(self, name_starts_with: str = "", include=None):
+        for name in sorted(self.blobs):
+            if name.startswith(name_starts_with):
+                blob = self.blobs[name]
+                yield SimpleNamespace(
+                    name=name,
+                    etag=blob["etag"],
+                    metadata=dict(blob["metadata"]) if include and "metadata" in include else None
+                )
+
+    def put(self, blob_path: str, data: bytes) -> str:
+        return self.client(blob_path).upload_blob(data, overwrite=True)["etag"]
+
+
+@pytest.fixture
+def blobs(monkeypatch):
+    store = FakeBlobStore()
+    monkeypatch.setattr(function_app, "get_blob_client", store.client)
+    monkeypatch.setattr(function_app, "get_container_client", store.container)
+    function_app.load_payload_content.cache_clear()
+    return store
@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+
+import azure.functions as func
+import pytest
+
+import function_app
+
+
+@pytest.fixture
+def computed(blobs, monkeypatch):
+    """Stubs the anomaly run; returns the (project, report, sow, start) calls."""
+    calls = []
+
+    def compute(project, daily_report_file, final_sow_file, start_date):
+        calls.append((project, daily_report_file, final_sow_file, start_date))
+        return {"anomalies": "", "reportingWeek": 1, "reportDate": "2026-03-02", "precomputed": False}
+
+    monkeypatch.setattr(function_app, "compute_daily_report_anomalies", compute)
+    return calls
+
+
+def anomaly_request(sow: str, start: str) -> func.HttpRequest:
+    return func.HttpRequest(
+        "POST",
+        "/api/daily-reports/anomaly-detect",
+        body=f'{{"projectName": "p", "files": ["day1.pdf", "{sow}"], "anomalyStartDate": "{start}"}}'.encode()
+    )
+
+
+def test_anomaly_endpoint_fills_missing_settings(computed):
+    function_app.detect_daily_report_anomalies(anomaly_request("sow.pdf", "2026-03-01"))
+
+    assert function_app.load_project_settings("p") == {
+        "finalSowFile": "sow.pdf",
+        "startDate": "2026-03-01"
+    }
+
+
+def test_anomaly_endpoint_keeps_configured_settings(computed):
+    function_app.save_project_settings("p", finalSowFile="sow.pdf", startDate="2026-03-01")
+
+    function_app.detect_daily_report_anomalies(anomaly_request("other-sow.pdf", "2026-04-01"))
+
+    assert computed == [("p", "day1.pdf", "other-sow.pdf", "2026-04-01")]
+    assert function_app.load_project_settings("p") == {
+        "finalSowFile": "sow.pdf",
+        "startDate": "2026-03-01"
+    }
+
+
+def test_trigger_uses_stored_settings(computed):
+    function_app.save_project_settings("p", finalSowFile="sow.pdf", startDate="2026-03-01")
+
+    function_app.precompute_daily_report_anomalies(SimpleNamespace(blob_name="daily-reports/p/day1.pdf"))
+
+    assert computed == [("p", "day1.pdf", "sow.pdf", "2026-03-01")]
+
+
+def test_trigger_skips_non_pdf_and_unconfigured_projects(computed):
+    function_app.precompute_daily_report_anomalies(SimpleNamespace(blob_name="daily-reports/p/day1.pdf"))
+
+    function_app.save_project_settings("p", finalSowFile="sow.pdf", startDate="2026-03-01")
+    function_app.precompute_daily_report_anomalies(
+        SimpleNamespace(blob_name="daily-reports/p/final-report.xlsx")
+    )
+
+    assert computed == []
@@ -0,0 +1,63 @@
+from types import SimpleNamespace
+
+import pytest
+
+import function_app
+
+
+def reply(text: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = function_app.SqliteAnomalyStore(str(tmp_path / "anomalies.db"))
+    monkeypatch.setattr(function_app, "_anomaly_store", store)
+    return store
+
+
+@pytest.fixture
+def project(blobs, monkeypatch):
+    """A project with one daily report and two SOWs; the model's answer names the SOW."""
+    blobs.put("daily-reports/p/day1.pdf", b"%PDF day1")
+    blobs.put("p/sow-a.pdf", b"%PDF a")
+    blobs.put("p/sow-b.pdf", b"%PDF b")
+
+    text = {
+        "daily-reports/p/day1.pdf": "Daily report 2026-03-10\nBlockwork level 2",
+        "p/sow-a.pdf": "SOW A",
+        "p/sow-b.pdf": "SOW B",
+    }
+    monkeypatch.setattr(function_app, "read_pdf_pages_from_blob_path", lambda path, engine=None: [text[path]])
+
+    calls = []
+
+    def chat_completion(messages, **kwargs):
+        sow = "A" if any("SOW A" in m["content"] for m in messages) else "B"
+        calls.append(sow)
+        return reply(f"• Blockwork | Per SOW {sow} | Behind | Impact: High")
+
+    monkeypatch.setattr(function_app, "chat_completion", chat_completion)
+    return calls
+
+
+def test_rows_follow_the_result_last_served_for_a_report(store, project):
+    configured = ("p", "day1.pdf", "sow-a.pdf", "2026-03-01")
+    adhoc = ("p", "day1.pdf", "sow-b.pdf", "2026-03-01")
+
+    function_app.compute_daily_report_anomalies(*configured)
+    function_app.compute_daily_report_anomalies(*adhoc)
+    again = function_app.compute_daily_report_anomalies(*configured)
+
+    rows = store.query("p")
+    assert again["precomputed"] is True
+    assert project == ["A", "B"]
+    assert [r["expected"] for r in rows] == ["Per SOW A"]
+
+
+def test_new_report_version_replaces_rows(store, project, blobs):
+    function_app.compute_daily_report_anomalies("p", "day1.pdf", "sow-a.pdf", "2026-03-01")
+    blobs.put("daily-reports/p/day1.pdf", b"%PDF day1 v2")
+    function_app.compute_daily_report_anomalies("p", "day1.pdf", "sow-a.pdf", "2026-03-01")
+
+    assert len(store.query("p", 2, 2, ["High"])) == 1
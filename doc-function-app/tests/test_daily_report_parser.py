@@ -0,0 +1,100 @@
+import pytest
+
+import function_app
+
+REPORT = """\
+DAILY PROGRESS REPORT
+Project: Tower A          Date: 14-Jan-2026
+Weather: Sunny, 31°C
+
+Manpower:
+Mason 12
+Carpenter - 8 nos
+Helpers: 20
+Total manpower: 40
+
+Work Carried Out:
+1. Blockwork level 3 1,200 sqm
+2. Plastering lift lobby 2,5 m
+- Shuttering for slab edge
+Remarks:
+Concrete delivery delayed by 2 hours
+"""
+
+
+@pytest.fixture
+def record():
+    return function_app.parse_daily_report([REPORT])
+
+
+def test_header_fields(record):
+    assert record["parserVersion"] == function_app.DAILY_REPORT_PARSER_VERSION
+    assert record["reportDate"] == "2026-01-14"
+    assert record["weather"] == "Sunny, 31°C"
+
+
+def test_manpower_by_trade_and_stated_total(record):
+    assert record["manpower"] == {"Mason": 12, "Carpenter": 8, "Helpers": 20}
+    assert record["manpowerTotal"] == 40
+
+
+def test_manpower_total_falls_back_to_sum_of_trades():
+    record = function_app.parse_daily_report(["Manpower:\nMason 5\nFitter 3\n"])
+
+    assert record["manpowerTotal"] == 8
+
+
+def test_activities_with_quantities(record):
+    assert record["activities"] == [
+        {"description": "Blockwork level 3 1,200 sqm", "quantity": 1200.0, "unit": "sqm"},
+        {"description": "Plastering lift lobby 2,5 m", "quantity": 2.5, "unit": "m"},
+        {"description": "Shuttering for slab edge", "quantity": None, "unit": None},
+    ]
+
+
+def test_unrelated_heading_ends_the_section(record):
+    descriptions = [a["description"] for a in record["activities"]]
+
+    assert "Concrete delivery delayed by 2 hours" not in descriptions
+
+
+def test_only_header_pages_are_parsed():
+    pages = ["Date: 2026-01-14\n", "Activities:\nExcavation grid A\n", "Activities:\nPiling grid B\n"]
+
+    record = function_app.parse_daily_report(pages)
+
+    assert function_app.DAILY_REPORT_HEADER_PAGES == 2
+    assert [a["description"] for a in record["activities"]] == ["Excavation grid A"]
+
+
+def test_missing_fields_are_left_empty():
+    record = function_app.parse_daily_report(["Nothing structured here\n"])
+
+    assert record["reportDate"] is None
+    assert record["weather"] is None
+    assert record["manpower"] == {}
+    assert record["manpowerTotal"] is None
+    assert record["activities"] == []
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("1,200", 1200.0),
+    ("12,000.5", 12000.5),
+    ("1,234,567", 1234567.0),
+    ("2,5", 2.5),
+    ("3.75", 3.75),
+    ("45", 45.0),
+])
+def test_parse_quantity(value, expected):
+    assert function_app.parse_quantity(value) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Report dated 14-Jan-2026", "2026-01-14"),
+    ("Report dated 14 Jan 2026", "2026-01-14"),
+    ("Report dated 2026-01-14", "2026-01-14"),
+    ("Report dated 31-Feb-2026 or 2026-02-27", "2026-02-27"),
+    ("No date", None),
+])
+def test_extract_report_date(text, expected):
+    assert function_app.extract_report_date(text) == expected
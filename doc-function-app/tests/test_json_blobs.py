@@ -0,0 +1,42 @@
+import gzip
+import json
+
+import function_app
+
+
+def test_update_json_blob_retries_after_concurrent_write(blobs):
+    path = "_derived/p/uploads/hashes.json"
+    blobs.put(path, b'{"a": 1}')
+    calls = []
+
+    def mutate(data):
+        calls.append(dict(data))
+        if len(calls) == 1:
+            # Another writer lands between our read and our conditional write
+            blobs.put(path, b'{"a": 1, "b": 2}')
+        data["c"] = 3
+
+    function_app.update_json_blob(path, mutate)
+
+    assert calls == [{"a": 1}, {"a": 1, "b": 2}]
+    assert function_app.load_json_blob(path)[0] == {"a": 1, "b": 2, "c": 3}
+
+
+def test_search_index_is_written_as_gzip_payload(blobs):
+    function_app.index_document("p", "p/sow.pdf", '"1"', ["blockwork level two"])
+
+    blob = blobs.blobs[function_app.search_index_path("p")]
+    index = json.loads(gzip.decompress(blob["data"]))
+
+    assert blob["content_encoding"] is None
+    assert index["version"] == function_app.SEARCH_INDEX_VERSION
+    assert "p/sow.pdf" in index["docs"]
+
+
+def test_outdated_search_index_is_rebuilt_on_update(blobs):
+    blobs.put(function_app.search_index_path("p"), gzip.compress(b'{"version": 0, "docs": {"x": {}}}'))
+
+    function_app.index_document("p", "p/sow.pdf", '"1"', ["blockwork"])
+
+    index, _ = function_app.load_search_index("p")
+    assert set(index["docs"]) == {"p/sow.pdf"}
@@ -0,0 +1,242 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import function_app
+from function_app import LLMAdmission, LLMBusyError
+
+MESSAGES = [{"role": "user", "content": "Summarise the report"}]
+
+
+def rate_limited(retry_after_ms: int) -> openai.RateLimitError:
+    response = httpx.Response(
+        429,
+        headers={"retry-after-ms": str(retry_after_ms)},
+        request=httpx.Request("POST", "https://localhost/chat/completions")
+    )
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+def completion(text: str = "ok"):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=text))],
+        usage=None
+    )
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    admission = LLMAdmission(tokens_per_minute=600_000, requests_per_minute=6_000)
+    monkeypatch.setattr(function_app, "llm_admission", admission)
+    return admission
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """Fake deployment: replies are taken from the `script` list in order."""
+    script = []
+    calls = []
+
+    def create(**kwargs):
+        calls.append(kwargs)
+        outcome = script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(function_app, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=create))
+    ))
+    return SimpleNamespace(script=script, calls=calls)
+
+
+# ---------- token buckets ----------
+
+def test_buckets_refill_in_proportion_to_elapsed_time():
+    admission = LLMAdmission(tokens_per_minute=600, requests_per_minute=60)
+    admission.tokens = 0
+    admission.requests = 0
+    admission.updated = 100.0
+
+    admission._refill(110.0)
+
+    assert admission.tokens == pytest.approx(100)
+    assert admission.requests == pytest.approx(10)
+
+    admission._refill(1000.0)
+
+    assert admission.tokens == 600
+    assert admission.requests == 60
+
+
+def test_wait_time_covers_the_scarcer_bucket():
+    admission = LLMAdmission(tokens_per_minute=600, requests_per_minute=60)
+    admission.tokens = 50
+    admission.requests = 0.5
+
+    # 50 more tokens at 10/s, half a request at 1/s
+    assert admission._wait_time(100, now=0.0) == pytest.approx(5.0)
+    assert admission._wait_time(10, now=0.0) == pytest.approx(0.5)
+
+
+def test_acquire_spends_and_release_settles_the_estimate():
+    admission = LLMAdmission(tokens_per_minute=1000, requests_per_minute=10)
+
+    admission.acquire("p", 400)
+    assert admission.tokens == pytest.approx(600, abs=1)
+    assert admission.active == {"p": 1}
+
+    admission.release("p", 400, actual=100)
+    assert admission.tokens == pytest.approx(900, abs=1)
+    assert admission.active == {}
+
+
+def test_acquire_gives_up_at_the_deadline():
+    admission = LLMAdmission(tokens_per_minute=60, requests_per_minute=60)
+    admission.tokens = 0
+
+    with pytest.raises(LLMBusyError) as busy:
+        admission.acquire("p", 30, deadline=time.monotonic() + 0.05)
+
+    assert busy.value.retry_after >= 1
+    assert admission.waiting == []
+
+
+def test_waiting_callers_are_admitted_fairly_across_projects():
+    # One request every 50ms, none available now
+    admission = LLMAdmission(tokens_per_minute=10_000_000, requests_per_minute=1200)
+    admission.requests = 0
+    admission.active = {"A": 1}
+    admission.pause(0.3)
+
+    order = []
+
+    def call(project):
+        admission.acquire(project, 1)
+        order.append(project)
+
+    threads = []
+    for project in ("A", "A", "B", "C"):
+        thread = threading.Thread(target=call, args=(project,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)  # fixes arrival order
+
+    for thread in threads:
+        thread.join(5)
+
+    # B and C have nothing in flight, so they go ahead of A's queued calls
+    assert order == ["B", "C", "A", "A"]
+
+
+# ---------- retries and the call deadline ----------
+
+def test_retries_after_service_retry_after(admission, model, monkeypatch):
+    monkeypatch.setattr(function_app.random, "uniform", lambda a, b: 0)
+    model.script.extend([rate_limited(20), completion("second try")])
+
+    result = function_app._call_model(MESSAGES, 0, "p", "adhoc")
+
+    assert result.choices[0].message.content == "second try"
+    assert len(model.calls) == 2
+    assert admission.active == {}
+
+
+def test_retry_after_beyond_the_deadline_fails_fast(admission, model, monkeypatch):
+    monkeypatch.setattr(function_app, "LLM_MAX_WAIT_SECONDS", 5.0)
+    model.script.append(rate_limited(120_000))
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError) as busy:
+        function_app._call_model(MESSAGES, 0, "p", "adhoc")
+
+    assert time.monotonic() - started < 1
+    assert busy.value.retry_after == pytest.approx(120)
+    assert len(model.calls) == 1
+
+
+def test_deadline_covers_all_attempts(admission, model, monkeypatch):
+    monkeypatch.setattr(function_app, "LLM_MAX_WAIT_SECONDS", 0.5)
+    monkeypatch.setattr(function_app, "LLM_MAX_RETRIES", 50)
+    monkeypatch.setattr(function_app.random, "uniform", lambda a, b: 0)
+    model.script.extend(rate_limited(150) for _ in range(50))
+
+    started = time.monotonic()
+    with pytest.raises(LLMBusyError):
+        function_app._call_model(MESSAGES, 0, "p", "adhoc")
+
+    assert time.monotonic() - started < 1
+    assert len(model.calls) <= 4
+
+
+# ---------- coalescing ----------
+
+def run_coalesced(monkeypatch, outcome):
+    """Leader blocks in the model call while two followers join; returns their results."""
+    release = threading.Event()
+    calls = []
+
+    def call_model(messages, temperature, project, prompt_name):
+        calls.append(project)
+        release.wait(5)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(function_app, "_call_model", call_model)
+    results = {}
+
+    def call(name):
+        try:
+            results[name] = function_app.chat_completion(MESSAGES, 0, project=name)
+        except Exception as e:
+            results[name] = e
+
+    threads = [threading.Thread(target=call, args=(name,)) for name in ("leader", "f1", "f2")]
+    threads[0].start()
+    time.sleep(0.05)
+    for thread in threads[1:]:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    return calls, results
+
+
+def test_followers_receive_the_leaders_result(monkeypatch):
+    answer = completion("shared")
+
+    calls, results = run_coalesced(monkeypatch, answer)
+
+    assert calls == ["leader"]
+    assert results == {"leader": answer, "f1": answer, "f2": answer}
+    assert function_app._llm_flights == {}
+
+
+def test_followers_receive_the_leaders_error(monkeypatch):
+    error = LLMBusyError(12)
+
+    calls, results = run_coalesced(monkeypatch, error)
+
+    assert calls == ["leader"]
+    assert results == {"leader": error, "f1": error, "f2": error}
+    assert function_app._llm_flights == {}
+
+
+def test_later_identical_prompt_makes_a_new_call(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        function_app, "_call_model",
+        lambda messages, temperature, project, prompt_name: calls.append(project) or completion()
+    )
+
+    function_app.chat_completion(MESSAGES, 0, project="a")
+    function_app.chat_completion(MESSAGES, 0, project="b")
+
+    assert calls == ["a", "b"]
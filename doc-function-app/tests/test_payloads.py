@@ -0,0 +1,42 @@
+import gzip
+
+from azure.storage.blob import ContentSettings
+
+import function_app
+
+
+def test_payload_content_round_trips_through_download_blob(blobs):
+    content = "Blockwork 1,200 sqm\nPlaster level 2\n"
+
+    content_ref = function_app.store_payload_content("p", content)
+    function_app.load_payload_content.cache_clear()
+
+    assert content_ref.startswith("sha256:")
+    assert function_app.load_payload_content("p", content_ref) == content
+
+
+def test_payload_content_is_stored_without_content_encoding(blobs):
+    content_ref = function_app.store_payload_content("p", "some text")
+
+    blob = blobs.blobs[function_app.payload_content_path("p", content_ref)]
+    assert blob["content_encoding"] is None
+    assert gzip.decompress(blob["data"]) == b"some text"
+
+
+def test_payload_content_written_with_gzip_encoding_still_loads(blobs):
+    # Blobs written before the fix carry Content-Encoding: gzip
+    content_ref = "sha256:" + "0" * 64
+    blobs.client(function_app.payload_content_path("p", content_ref)).upload_blob(
+        gzip.compress(b"legacy text"),
+        content_settings=ContentSettings(content_type="text/plain", content_encoding="gzip")
+    )
+
+    assert function_app.load_payload_content("p", content_ref) == "legacy text"
+
+
+def test_offloaded_row_content_resolves(blobs):
+    row = function_app.offload_payload_content("p", {"project": "p", "fileName": "r.pdf", "content": "day one"})
+    function_app.load_payload_content.cache_clear()
+
+    assert "content" not in row
+    assert function_app.payload_content(row) == "day one"
@@ -0,0 +1,137 @@
+import json
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+import function_app
+
+SOW = """\
+SCOPE OF WORK AGREEMENT
+Project: Tower A residential block
+1. Scope of Work
+1.1 Excavation for foundations grid A-D
+1.2 Reinforced concrete footings and plinth beams
+1.3 Blockwork walls level 1 1,200 sqm
+1.4 Internal plastering level 1
+1.5 Floor tiling lift lobby 450 sqm
+2. Payment Terms
+Monthly progress payments against certified work
+3. Retention
+Five percent retention released at handover
+4. Liquidated Damages
+LDs at 0.1% per day of delay capped at 10%
+"""
+
+DAILY = [
+    "Excavation for foundations grid A-D completed",
+    "Reinforced concrete footings and plinth beams cast",
+    "Blockwork walls level 1 completed 1,200 sqm",
+    "Internal plastering level 1 completed",
+    "Floor tiling lift lobby completed",
+]
+
+
+def rows(activities_by_day):
+    start = date(2026, 3, 2)
+    return [
+        {
+            "normalized_date": start + timedelta(days=i),
+            "data": json.dumps({
+                "project": "p",
+                "type": "daily_report",
+                "content": "\n".join(activities),
+                "record": {"activities": [{"description": a} for a in activities]},
+            }),
+        }
+        for i, activities in enumerate(activities_by_day)
+    ]
+
+
+@pytest.fixture
+def no_llm(blobs, monkeypatch):
+    calls = []
+
+    def estimate_with_llm(project, final_lines, batch, previous_progress):
+        calls.append([day for day, _, _ in batch])
+        return {day: local for day, _, local in batch}
+
+    monkeypatch.setattr(function_app, "estimate_progress_with_llm", estimate_with_llm)
+    return calls
+
+
+def test_work_items_come_from_the_scope_section():
+    assert function_app.final_report_work_items(SOW) == [
+        "Excavation for foundations grid A-D",
+        "Reinforced concrete footings and plinth beams",
+        "Blockwork walls level 1 1,200 sqm",
+        "Internal plastering level 1",
+        "Floor tiling lift lobby 450 sqm",
+    ]
+
+
+def test_work_items_without_scope_heading_use_enumerated_lines():
+    text = "Tower A\nThe contractor shall carry out:\n- Excavation grid A\n- Piling grid B\nPayment Terms\n- Monthly invoices\n"
+
+    assert function_app.final_report_work_items(text) == ["Excavation grid A", "Piling grid B"]
+
+
+def test_work_items_fall_back_to_all_lines():
+    text = "Excavation grid A\nPiling grid B\n"
+
+    assert function_app.final_report_work_items(text) == ["Excavation grid A", "Piling grid B"]
+
+
+def test_progress_reaches_completion_when_every_item_is_done(no_llm):
+    final = json.dumps({"project": "p", "content": SOW})
+
+    progress_map, counts = function_app.estimate_progress("p", final, rows([[a] for a in DAILY]))
+
+    assert list(progress_map.values()) == [20.0, 40.0, 60.0, 80.0, 100.0]
+    assert counts == {"local": 5, "llm": 0, "cached": 0}
+    assert no_llm == []
+
+
+def test_unmatched_work_lowers_confidence():
+    items = function_app.final_report_work_items(SOW)
+    day = date(2026, 3, 2)
+
+    [matched] = function_app.estimate_progress_locally(items, [(day, [DAILY[0]])])
+    [mixed] = function_app.estimate_progress_locally(
+        items, [(day, [DAILY[0], "Scaffolding erected on north facade", "Site cleaning around hoarding"])]
+    )
+    [unmatched] = function_app.estimate_progress_locally(items, [(day, ["Scaffolding erected on north facade"])])
+
+    assert matched["confidence"] == 1.0
+    assert mixed["confidence"] < function_app.PROGRESS_CONFIDENCE_THRESHOLD
+    assert unmatched["confidence"] == 0.0
+    assert unmatched["progress"] == 0.0
+
+
+def test_low_confidence_days_go_to_the_model_and_are_cached(no_llm):
+    final = json.dumps({"project": "p", "content": SOW})
+    daily = rows([[DAILY[0]], ["Scaffolding erected on north facade"]])
+
+    _, first = function_app.estimate_progress("p", final, daily)
+    _, second = function_app.estimate_progress("p", final, daily)
+
+    assert first == {"local": 1, "llm": 1, "cached": 0}
+    assert second == {"local": 1, "llm": 0, "cached": 1}
+    assert no_llm == [[date(2026, 3, 3)]]
+
+
+def test_progress_never_goes_down(no_llm):
+    final = json.dumps({"project": "p", "content": SOW})
+
+    progress_map, _ = function_app.estimate_progress(
+        "p", final, rows([[DAILY[0], DAILY[1]], [DAILY[0]]])
+    )
+
+    assert list(progress_map.values()) == [40.0, 40.0]
+
+
+def test_estimate_with_empty_work_item_list():
+    [estimate] = function_app.estimate_progress_locally([], [(date(2026, 3, 2), ["Anything at all here"])])
+
+    assert estimate["progress"] == 0.0
+    assert np.isfinite(estimate["confidence"])
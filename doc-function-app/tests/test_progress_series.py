@@ -0,0 +1,101 @@
+import random
+from datetime import date, timedelta
+
+import pytest
+
+import function_app
+
+
+def changes(progress_map, start=date(2026, 1, 1)):
+    return function_app.build_progress_changes(progress_map, start)
+
+
+def expand(series: dict, points: list) -> list:
+    """Points form of a changes-encoded series, for the bucket dates in points."""
+    dates = [date.fromisoformat(d) for d in series["dates"]]
+    return [
+        {"date": p["date"], "progress": function_app.progress_on(dates, series["progress"], date.fromisoformat(p["date"]))}
+        for p in points
+    ]
+
+
+def test_build_progress_changes_drops_pre_start_and_repeated_values():
+    dates, values = changes({
+        date(2025, 12, 30): 5,
+        date(2026, 1, 2): 10,
+        date(2026, 1, 3): 10,
+        date(2026, 1, 5): 20,
+    })
+
+    assert dates == [date(2026, 1, 2), date(2026, 1, 5)]
+    assert values == [10, 20]
+
+
+def test_progress_on_holds_last_change_and_starts_at_zero():
+    dates, values = [date(2026, 1, 2), date(2026, 1, 5)], [10, 20]
+
+    assert function_app.progress_on(dates, values, date(2026, 1, 1)) == 0
+    assert function_app.progress_on(dates, values, date(2026, 1, 2)) == 10
+    assert function_app.progress_on(dates, values, date(2026, 1, 4)) == 10
+    assert function_app.progress_on(dates, values, date(2026, 2, 1)) == 20
+
+
+def test_week_buckets_count_from_range_start_and_report_last_day():
+    dates, values = changes({date(2026, 1, 3): 10, date(2026, 1, 10): 30})
+
+    points = function_app.progress_series_points(
+        dates, values, date(2026, 1, 2), date(2026, 1, 20), "week"
+    )
+
+    assert points == [
+        {"date": "2026-01-02", "progress": 10},
+        {"date": "2026-01-09", "progress": 30},
+        {"date": "2026-01-16", "progress": 30},
+    ]
+
+
+def test_month_buckets_are_calendar_months_clamped_to_range_start():
+    dates, values = changes({date(2026, 1, 20): 10, date(2026, 3, 1): 40})
+
+    points = function_app.progress_series_points(
+        dates, values, date(2026, 1, 15), date(2026, 3, 10), "month"
+    )
+
+    assert points == [
+        {"date": "2026-01-15", "progress": 10},
+        {"date": "2026-02-01", "progress": 10},
+        {"date": "2026-03-01", "progress": 40},
+    ]
+    assert function_app.next_progress_bucket(date(2026, 12, 1), "month") == date(2027, 1, 1)
+
+
+def test_changes_encoding_keeps_only_buckets_that_move():
+    dates, values = changes({date(2026, 1, 3): 10, date(2026, 1, 4): 15, date(2026, 1, 20): 30})
+
+    series = function_app.progress_series_changes(
+        dates, values, date(2026, 1, 1), date(2026, 1, 31), "week"
+    )
+
+    assert series == {"dates": ["2026-01-01", "2026-01-15"], "progress": [15, 30]}
+
+
+@pytest.mark.parametrize("resolution", function_app.PROGRESS_RESOLUTIONS)
+def test_changes_encoding_matches_points(resolution):
+    rng = random.Random(26)
+
+    for _ in range(200):
+        start = date(2026, 1, 1) + timedelta(days=rng.randrange(60))
+        progress_map = {}
+        progress = 0
+        for _ in range(rng.randrange(12)):
+            progress = min(100, progress + rng.choice([0, 1, 5]))
+            progress_map[date(2025, 12, 1) + timedelta(days=rng.randrange(200))] = progress
+
+        dates, values = changes(progress_map, date(2025, 12, 1))
+        range_start = start
+        range_end = start + timedelta(days=rng.randrange(150))
+
+        points = function_app.progress_series_points(dates, values, range_start, range_end, resolution)
+        series = function_app.progress_series_changes(dates, values, range_start, range_end, resolution)
+
+        assert expand(series, points) == points
@@ -0,0 +1,82 @@
+import gzip
+
+import azure.functions as func
+import brotli
+import pytest
+
+import function_app
+
+
+def request(accept_encoding: str | None) -> func.HttpRequest:
+    headers = {"Accept-Encoding": accept_encoding} if accept_encoding is not None else {}
+    return func.HttpRequest("GET", "/api/test", headers=headers, body=b"")
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("gzip, deflate, br", "br"),
+    ("br;q=0, gzip", "gzip"),
+    ("br;q=0.5, gzip;q=1", "br"),
+    ("gzip;q=0", None),
+    ("*", "br"),
+    ("*;q=0", None),
+    ("*, br;q=0", "gzip"),
+    ("*;q=0, gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("br;q=bogus, gzip", "gzip"),
+])
+def test_negotiate_encoding(accept, expected):
+    assert function_app.negotiate_encoding(request(accept)) == expected
+
+
+def test_negotiate_encoding_without_request():
+    assert function_app.negotiate_encoding(None) is None
+
+
+def test_gzip_only_when_brotli_is_unavailable(monkeypatch):
+    monkeypatch.setattr(function_app, "brotli", None)
+
+    assert function_app.negotiate_encoding(request("br, gzip")) == "gzip"
+    assert function_app.negotiate_encoding(request("br")) is None
+
+
+def test_small_bodies_are_not_compressed():
+    response = function_app.json_response({"ok": True}, req=request("br, gzip"))
+
+    assert "Content-Encoding" not in response.headers
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.get_body() == b'{"ok":true}'
+
+
+@pytest.mark.parametrize("accept, encoding, decode", [
+    ("br", "br", brotli.decompress),
+    ("gzip", "gzip", gzip.decompress),
+])
+def test_bodies_at_threshold_are_compressed(accept, encoding, decode):
+    payload = {"text": "x" * function_app.RESPONSE_COMPRESS_MIN_BYTES}
+
+    response = function_app.json_response(payload, req=request(accept))
+
+    assert response.headers["Content-Encoding"] == encoding
+    assert decode(response.get_body()) == function_app.encode_json(payload)
+
+
+def test_without_request_no_negotiation_happens():
+    payload = {"text": "x" * 4096}
+
+    response = function_app.json_response(payload)
+
+    assert "Content-Encoding" not in response.headers
+    assert "Vary" not in response.headers
+
+
+def test_error_response_shape_and_headers():
+    response = function_app.error_response("busy", 503, request(None), {"Retry-After": "5"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "5"
+    assert response.mimetype == "application/json"
+    assert response.get_body() == b'{"error":"busy"}'
@@ -0,0 +1,84 @@
+import hashlib
+import json
+
+import azure.functions as func
+import pytest
+
+import function_app
+
+CONTENT = b"%PDF day1"
+SHA = hashlib.sha256(CONTENT).hexdigest()
+BOUNDARY = "test-boundary"
+
+ROUTES = [
+    (function_app.upload_project_file, "p/day1.pdf"),
+    (function_app.upload_daily_report, "daily-reports/p/day1.pdf"),
+]
+
+
+def upload_request(headers: dict | None = None, body: bytes = b"") -> func.HttpRequest:
+    return func.HttpRequest(
+        "POST",
+        "/api/projects/p/upload",
+        headers=headers or {},
+        route_params={"projectName": "p"},
+        body=body
+    )
+
+
+def form_request(fields: dict) -> func.HttpRequest:
+    body = "".join(
+        f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+        for name, value in fields.items()
+    ) + f"--{BOUNDARY}--\r\n"
+    return upload_request({"Content-Type": f"multipart/form-data; boundary={BOUNDARY}"}, body.encode())
+
+
+def stored(blobs, blob_path: str):
+    etag = blobs.put(blob_path, CONTENT)
+    function_app.record_content_hash("p", SHA, blob_path, etag)
+
+
+@pytest.mark.parametrize("route, blob_path", ROUTES)
+def test_known_hash_in_header_skips_the_body(blobs, route, blob_path):
+    stored(blobs, blob_path)
+
+    response = route(upload_request({function_app.CONTENT_HASH_HEADER: SHA.upper()}))
+
+    assert response.status_code == 200
+    body = json.loads(response.get_body())
+    assert body["deduplicated"] is True
+    assert body["path"] == blob_path
+    assert body["sha256"] == SHA
+
+
+@pytest.mark.parametrize("route, blob_path", ROUTES)
+def test_known_hash_in_form_field_skips_the_body(blobs, route, blob_path):
+    stored(blobs, blob_path)
+
+    response = route(form_request({"sha256": SHA}))
+
+    assert response.status_code == 200
+    assert json.loads(response.get_body())["path"] == blob_path
+
+
+@pytest.mark.parametrize("route, blob_path", ROUTES)
+def test_unknown_hash_asks_for_the_file(blobs, route, blob_path):
+    response = route(upload_request({function_app.CONTENT_HASH_HEADER: "0" * 64}))
+
+    assert response.status_code == 404
+
+
+def test_hash_stored_under_the_other_route_is_not_reused(blobs):
+    stored(blobs, "p/day1.pdf")
+
+    response = function_app.upload_daily_report(upload_request({function_app.CONTENT_HASH_HEADER: SHA}))
+
+    assert response.status_code == 404
+
+
+@pytest.mark.parametrize("headers", [{}, {function_app.CONTENT_HASH_HEADER: "not-a-hash"}])
+def test_missing_file_or_malformed_hash_is_rejected(blobs, headers):
+    response = function_app.upload_project_file(upload_request(headers))
+
+    assert response.status_code == 400
@@ -0,0 +1,103 @@
+import json
+from types import SimpleNamespace
+
+import azure.functions as func
+import pytest
+
+import function_app
+
+
+@pytest.fixture
+def extractions(blobs, monkeypatch):
+    """Stubs PDF extraction; returns the list of blob paths extracted."""
+    extracted = []
+
+    def read_pages(blob_path, engine=None):
+        extracted.append(blob_path)
+        return [f"{blob_path} blockwork level two"]
+
+    monkeypatch.setattr(function_app, "read_pdf_pages_from_blob_path", read_pages)
+    monkeypatch.setattr(function_app, "_warmup_futures", {})
+    return extracted
+
+
+def test_warm_up_indexes_then_reports_ready(blobs, extractions):
+    blobs.put("p/sow.pdf", b"%PDF sow")
+    blobs.put("daily-reports/p/day1.pdf", b"%PDF day1")
+    blobs.put("daily-reports/p/final-report.xlsx", b"xlsx")
+
+    first = function_app.warm_up_project("p")
+
+    assert first["total"] == 2
+    assert first["ready"] == 2
+    assert first["done"] is True
+    assert sorted(extractions) == ["daily-reports/p/day1.pdf", "p/sow.pdf"]
+
+    index, _ = function_app.load_search_index("p")
+    assert set(index["docs"]) == {"daily-reports/p/day1.pdf", "p/sow.pdf"}
+
+    second = function_app.warm_up_project("p")
+
+    assert second == first
+    assert len(extractions) == 2
+
+
+def test_warm_up_rebuilds_missing_text_cache(blobs, extractions):
+    blobs.put("p/sow.pdf", b"%PDF sow")
+    function_app.warm_up_project("p")
+
+    blobs.client(function_app.document_text_cache_path("p", "p/sow.pdf")).delete_blob()
+    result = function_app.warm_up_project("p")
+
+    assert result["done"] is True
+    assert extractions == ["p/sow.pdf", "p/sow.pdf"]
+    assert function_app.load_document_pages("p", "p/sow.pdf") == ["p/sow.pdf blockwork level two"]
+    assert len(extractions) == 2
+
+
+def test_warm_up_reextracts_replaced_document(blobs, extractions):
+    blobs.put("p/sow.pdf", b"%PDF sow")
+    function_app.warm_up_project("p")
+
+    new_etag = blobs.put("p/sow.pdf", b"%PDF sow v2")
+    function_app.warm_up_project("p")
+
+    index, _ = function_app.load_search_index("p")
+    assert extractions == ["p/sow.pdf", "p/sow.pdf"]
+    assert index["docs"]["p/sow.pdf"]["etag"] == new_etag
+
+
+def test_warm_up_drops_deleted_documents_from_index(blobs, extractions):
+    blobs.put("p/sow.pdf", b"%PDF sow")
+    blobs.put("p/old.pdf", b"%PDF old")
+    function_app.warm_up_project("p")
+
+    blobs.client("p/old.pdf").delete_blob()
+    result = function_app.warm_up_project("p")
+
+    index, _ = function_app.load_search_index("p")
+    assert result["total"] == 1
+    assert set(index["docs"]) == {"p/sow.pdf"}
+
+
+def test_warmed_document_chat_reads_the_text_cache(blobs, extractions, monkeypatch):
+    blobs.put("p/sow.pdf", b"%PDF sow")
+    function_app.warm_up_project("p")
+
+    prompts = []
+
+    def chat_completion(messages, **kwargs):
+        prompts.append(messages)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="Level two"))])
+
+    monkeypatch.setattr(function_app, "chat_completion", chat_completion)
+    response = function_app.document_chat(func.HttpRequest(
+        "POST",
+        "/api/document-chat",
+        body=b'{"projectName": "p", "fileName": "sow.pdf", "question": "Which level?"}'
+    ))
+
+    assert response.status_code == 200
+    assert json.loads(response.get_body()) == {"answer": "Level two"}
+    assert extractions == ["p/sow.pdf"]
+    assert any("p/sow.pdf blockwork level two" in m["content"] for m in prompts[0])